@@ -0,0 +1,164 @@
+"""Background cache warmer.
+
+Walks every village after startup and after each data sync so the first view
+of a village is a cache hit.  Two modes:
+
+* in-process — ``CacheWarmer(store, portfolio, scenarios, offers, draws).start()``
+  fills the ``VillageStore`` and ``ScenarioCache`` entries the Streamlit pages
+  read at the sidebar and widget defaults: totals, competitor table, pie,
+  waterfall and solar sweep per village; Monte Carlo, sensitivity,
+  projection and portfolio solar sweep; wholesale series, all-states chart
+  and price draws.
+* sidecar — ``python cache_warmer.py --api http://127.0.0.1:8080`` requests
+  every village from a running ``tariff_api`` so its response cache is warm,
+  and repeats whenever ``/health`` reports a new data generation.
+
+Most-viewed villages (``VillageStore.record_view`` or ``--priority``) go first.
+"""
+import argparse
+import itertools
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from urllib.request import urlopen
+
+import tariff_views
+from tariff_engine import DEFAULT_RATE
+from village_sync import PORTFOLIO
+
+
+class CacheWarmer:
+    """Priority queue of villages to warm, drained by daemon worker threads."""
+
+    def __init__(self, store, portfolio, scenarios, offers=None, draws_cache=None, workers: int = 2,
+                 default_rate=DEFAULT_RATE, offer_limit: int = 10):
+        self.store = store
+        self.portfolio = portfolio
+        self.scenarios = scenarios
+        self.offers = offers
+        self.draws_cache = draws_cache
+        self.workers = workers
+        self.default_rate = default_rate
+        self.offer_limit = offer_limit
+        self._queue = queue.PriorityQueue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._order = itertools.count()      # FIFO among villages with the same view count
+        self._threads = []
+        self.warmed = 0
+        self.errors = 0
+
+    def start(self) -> "CacheWarmer":
+        if self._threads:
+            return self
+        self.store.subscribe(self.schedule)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"cache-warmer-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        self.schedule([tariff_views.WHOLESALE, PORTFOLIO, *self.store.villages()])
+        return self
+
+    def schedule(self, villages):
+        """Queue villages for warming; called from the sync thread, so it only enqueues."""
+        views = self.store.view_counts()
+        with self._lock:
+            for name in set(villages) | {PORTFOLIO}:
+                if name in self._pending:
+                    continue
+                self._pending.add(name)
+                # Shared entries first, then most-viewed villages
+                rank = -float("inf") if name in (tariff_views.WHOLESALE, PORTFOLIO) else -views.get(name, 0)
+                self._queue.put((rank, next(self._order), name))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            _, _, name = self._queue.get()
+            with self._lock:
+                self._pending.discard(name)
+            try:
+                self.warm(name)
+                self.warmed += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Could not warm {name}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def warm(self, name: str):
+        if name == tariff_views.WHOLESALE:
+            tariff_views.warm_wholesale(self.store, self.store.client, self.draws_cache)
+            return
+        if name != PORTFOLIO and not self.store.rows("village_inputs", name):
+            return                               # deleted since it was queued
+        for include_aws in (True, False):
+            tariff_views.warm_village(self.store, self.portfolio, self.scenarios, name, self.default_rate,
+                                      include_aws, self.offers, self.offer_limit, self.store.client,
+                                      self.draws_cache)
+
+
+# ───────────────────────────────────────────────────────────────
+# SIDECAR (warms a running tariff_api)
+# ───────────────────────────────────────────────────────────────
+def _get(url: str, timeout: float = 30.0):
+    with urlopen(url, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def warm_api(base: str, workers: int = 4, priority=()) -> int:
+    """GET every village endpoint once; returns the number of requests made."""
+    base = base.rstrip("/")
+    villages = _get(f"{base}/villages")["villages"]
+    rank = {name: i for i, name in enumerate(priority)}
+    villages.sort(key=lambda v: rank.get(v, len(rank)))
+    paths = ["/portfolio", "/portfolio/villages"] + [
+        f"/villages/{quote(v, safe='')}{suffix}"
+        for v in villages for suffix in ("", "/competitors", "/unbilled")]
+
+    def fetch(path):
+        try:
+            _get(base + path)
+        except Exception as e:
+            print(f"Could not warm {path}: {e}")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fetch, paths))
+    return len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep a tariff_api response cache warm")
+    parser.add_argument("--api", default="http://127.0.0.1:8080")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent requests")
+    parser.add_argument("--priority", default="", help="comma-separated villages to warm first")
+    parser.add_argument("--interval", type=float, default=30.0,
+                        help="seconds between checks for a new data generation")
+    parser.add_argument("--once", action="store_true", help="warm once and exit")
+    args = parser.parse_args()
+    priority = [p.strip() for p in args.priority.split(",") if p.strip()]
+
+    generation = None
+    while True:
+        try:
+            current = _get(f"{args.api.rstrip('/')}/health")["generation"]
+            if current != generation:
+                started = time.monotonic()
+                n = warm_api(args.api, args.workers, priority)
+                print(f"Warmed {n} endpoints for generation {current} "
+                      f"in {time.monotonic() - started:.1f}s")
+                generation = current
+        except Exception as e:
+            print(f"Tariff API not reachable: {e}")
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
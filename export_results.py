@@ -0,0 +1,264 @@
+"""Bulk export of computed village results for downstream analytics.
+
+Writes plain numeric tables (no ``money()`` strings) for every village:
+
+    quarterly      one row per village × quarter × usage/supply × res/common
+    financials     current vs simulated revenue and OPEX
+    competitors    ranked offers with their delta against the village tariff
+    unbilled       unbilled gate cost allocation at the proposed rates
+
+``village_inputs`` is read a page of villages at a time (keyset on
+``village_name``) and the matching tariff and offer rows are fetched per
+page, so memory stays flat however many villages there are.  Each table is written to ``<out>/<table>/run_date=YYYY-MM-DD/``
+as Parquet when pyarrow is available and as CSV otherwise; every run adds its
+own part file, so repeated exports append and the directory reads as a
+hive-partitioned dataset.  Parts are only published once the whole run has
+succeeded.
+
+Run with ``python export_results.py --out exports``.
+"""
+import argparse
+import csv
+import datetime as dt
+import os
+import time
+
+import pandas as pd
+
+from offer_catalogue import OfferCatalogue, load_plan_dumps, rank_offers, site_offers
+from supabase_transport import connect
+from tariff_engine import (DEFAULT_RATE, QUARTER_COL, proposed_rate, sfloat, stored_rate,
+                           supabase_credentials, unbilled_allocation, village_financials, village_totals)
+from village_sync import village_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:             # CSV fallback
+    pa = pq = None
+
+PAGE_SIZE = 200
+
+_S, _F, _I = "string", "float64", "int64"
+_CASE = {f"{case}_{k}": _F for case in ("current", "simulated")
+         for k in ("usage_rate", "daily_supply", "usage_rev", "supply_rev", "aws_rev",
+                   "total_rev", "opex")}
+SCHEMAS = {
+    "quarterly": {"village": _S, "state": _S, "quarter": _I, "kind": _S, "area": _S, "value": _F},
+    "financials": {"village": _S, "state": _S, "include_aws": "bool", "has_stored_tariff": "bool",
+                   "qty_total": _F, "site_kwh": _F, "nmi_total": _F, "total_cost": _F,
+                   "seene_costs": _F, **_CASE},
+    "competitors": {"village": _S, "rank": _I, "retailer": _S, "plan_name": _S, "plan_id": _S,
+                    "source": _S, "usage_rate": _F, "daily_charge": _F, "usage_cost": _F,
+                    "supply_cost": _F, "total_cost": _F, "village_total_rev": _F, "delta": _F,
+                    "delta_pct": _F},
+    "unbilled": {"village": _S, "usage_rate": _F, "daily_supply": _F, "resi_usage_rev": _F,
+                 "resi_supply_rev": _F, "total_res": _F, "common_usage_rev": _F,
+                 "common_supply_rev": _F, "total_common": _F, "unmetered_usage_kwh": _F,
+                 "unbilled_cost": _F, "unbilled_per_res_nmi_annual": _F,
+                 "unbilled_per_res_nmi_daily": _F, "unrecovered_cost": _F},
+}
+_ARROW = {_S: "string", _F: "float64", _I: "int64", "bool": "bool_"}
+
+
+# ───────────────────────────────────────────────────────────────
+# WRITERS
+# ───────────────────────────────────────────────────────────────
+def conform(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    """Columns and dtypes fixed per table so every chunk and run shares one schema."""
+    schema = SCHEMAS[table]
+    df = df.reindex(columns=list(schema))
+    for col, kind in schema.items():
+        if kind == _S:
+            df[col] = df[col].map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+        elif kind == "bool":
+            df[col] = df[col].fillna(False).astype(bool)
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(kind if kind == _F else "Int64")
+    return df
+
+
+class PartitionWriter:
+    """Streams chunks of one table into ``<root>/<table>/run_date=<date>/part-<run_id>``."""
+
+    def __init__(self, root: str, table: str, run_date: str, run_id: str, fmt: str):
+        directory = os.path.join(root, table, f"run_date={run_date}")
+        os.makedirs(directory, exist_ok=True)
+        self.table = table
+        self.fmt = fmt
+        self.path = os.path.join(directory, f"part-{run_id}.{fmt}")
+        self.rows = 0
+        self._tmp = self.path + ".tmp"           # readers never see a half-written part
+        self._writer = self._fh = self._csv = None
+        if fmt == "parquet":
+            schema = pa.schema([(c, getattr(pa, _ARROW[k])()) for c, k in SCHEMAS[table].items()])
+            self._schema = schema
+            self._writer = pq.ParquetWriter(self._tmp, schema, compression="zstd")
+        else:
+            self._fh = open(self._tmp, "w", newline="", encoding="utf-8")
+            self._csv = csv.writer(self._fh)
+            self._csv.writerow(SCHEMAS[table])
+
+    def write(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        df = conform(df, self.table)
+        if self._writer:
+            self._writer.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+        else:
+            self._csv.writerows(df.astype(object).where(df.notna(), "").itertuples(index=False))
+        self.rows += len(df)
+
+    def _close(self):
+        if self._writer:
+            self._writer.close()
+        elif not self._fh.closed:
+            self._fh.close()
+
+    def commit(self):
+        """Publish the part; only called once every table of the run is complete."""
+        self._close()
+        if self.rows:
+            os.replace(self._tmp, self.path)
+        else:
+            os.remove(self._tmp)                 # no empty parts
+
+    def abort(self):
+        try:
+            self._close()
+        finally:
+            if os.path.exists(self._tmp):
+                os.remove(self._tmp)
+
+
+# ───────────────────────────────────────────────────────────────
+# SOURCES
+# ───────────────────────────────────────────────────────────────
+def village_pages(client, page_size: int = PAGE_SIZE):
+    """Yield (village_inputs, en_tariffs, competitor_offers) rows for up to ``page_size`` villages at a time.
+
+    Pages are keyed on village name, not row offset, so a village's rows are
+    never split across two pages.
+    """
+    last = None
+    while True:
+        query = client.table("village_inputs").select("village_name").order("village_name")
+        if last is not None:
+            query = query.gt("village_name", last)
+        # Keep the database's order: the cursor must follow its collation, not Python's
+        names = list(dict.fromkeys(r["village_name"] for r in query.limit(page_size).execute().data
+                                   if r.get("village_name")))
+        if not names:
+            return
+        # The last name may be cut off by the limit; .in_ fetches all of its rows anyway
+        fetch = lambda t: client.table(t).select("*").in_("village_name", names).execute().data
+        yield fetch("village_inputs"), fetch("en_tariffs"), fetch("competitor_offers")
+        last = names[-1]
+
+
+def _by_village(rows) -> dict:
+    grouped = {}
+    for r in rows:
+        grouped.setdefault(village_key(r), []).append(r)
+    return grouped
+
+
+# ───────────────────────────────────────────────────────────────
+# TABLES
+# ───────────────────────────────────────────────────────────────
+def page_tables(inputs, tariffs, offers, sim_rate=DEFAULT_RATE, include_aws=True,
+                dumps: OfferCatalogue = None, on=None) -> dict:
+    """The four export tables for one page of villages."""
+    inputs, tariffs, offers = _by_village(inputs), _by_village(tariffs), _by_village(offers)
+    out = {name: [] for name in SCHEMAS}
+    for name, rows in inputs.items():
+        if not name:
+            continue
+        row = rows[0]
+        state = str(row.get("state") or "").strip().upper() or None
+        for r in rows:
+            for col, val in r.items():
+                m = QUARTER_COL.match(col.lower())
+                if m:
+                    out["quarterly"].append({"village": name, "state": state, "quarter": int(col[1]),
+                                             "kind": m.group(1), "area": m.group(2),
+                                             "value": sfloat(val)})
+
+        t = village_totals(rows)
+        rate = stored_rate(tariffs.get(name))
+        fin = village_financials(t, *(rate or sim_rate), *sim_rate, include_aws)
+        out["financials"].append({
+            "village": name, "state": state, "include_aws": include_aws,
+            "has_stored_tariff": rate is not None, "qty_total": t["qty_total"],
+            "site_kwh": t["site_kwh"], "nmi_total": t["nmi_total"],
+            "total_cost": t["village_total_cost"], "seene_costs": fin["current"]["seene_costs"],
+            **{f"{case}_{k}": fin[case][k] for case in ("current", "simulated")
+               for k in ("usage_rate", "daily_supply", "usage_rev", "supply_rev", "aws_rev",
+                         "total_rev", "opex")},
+        })
+
+        candidates = site_offers(name, (offers.get(name) or [None])[0], row, dumps, on)
+        if len(candidates):
+            ranked = rank_offers(candidates, t["qty_total"], t["nmi_total"]).reset_index(drop=True)
+            v_total = fin["current"]["total_rev"]
+            ranked = ranked.assign(
+                village=name, rank=ranked.index + 1, village_total_rev=v_total,
+                delta=ranked["total_cost"] - v_total,
+                delta_pct=(ranked["total_cost"] - v_total) / v_total * 100 if v_total else float("nan"))
+            out["competitors"].append(ranked)
+
+        out["unbilled"].append({"village": name, **unbilled_allocation(row, *proposed_rate(row))})
+
+    return {k: (pd.concat(v, ignore_index=True) if k == "competitors" and v else pd.DataFrame(v))
+            for k, v in out.items()}
+
+
+def export(client, root: str, run_date: str = None, fmt: str = None, sim_rate=DEFAULT_RATE,
+           include_aws: bool = True, dumps: OfferCatalogue = None, page_size: int = PAGE_SIZE) -> dict:
+    """Stream every village's results to ``root``; returns rows written per table."""
+    fmt = fmt or ("parquet" if pq else "csv")
+    if fmt == "parquet" and pq is None:
+        raise SystemExit("Parquet output needs pyarrow (pip install pyarrow) — or use --format csv")
+    run_date = run_date or dt.date.today().isoformat()
+    run_id = dt.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    writers = {}
+    try:
+        for t in SCHEMAS:
+            writers[t] = PartitionWriter(root, t, run_date, run_id, fmt)
+        for inputs, tariffs, offers in village_pages(client, page_size):
+            for table, df in page_tables(inputs, tariffs, offers, sim_rate, include_aws, dumps).items():
+                writers[table].write(df)
+    except BaseException:
+        # A failed run publishes nothing, so the dataset never holds a partial export
+        for w in writers.values():
+            w.abort()
+        raise
+    for w in writers.values():
+        w.commit()
+    return {t: w.rows for t, w in writers.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export computed village results as Parquet/CSV")
+    parser.add_argument("--out", default="exports", help="dataset root directory")
+    parser.add_argument("--format", choices=("parquet", "csv"), help="default: parquet if pyarrow is installed")
+    parser.add_argument("--run-date", help="partition date (default: today)")
+    parser.add_argument("--usage-rate", type=float, default=DEFAULT_RATE[0], help="simulated c/kWh")
+    parser.add_argument("--daily-supply", type=float, default=DEFAULT_RATE[1], help="simulated $/day")
+    parser.add_argument("--no-aws", action="store_true", help="exclude the AWS service fee")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="villages per chunk")
+    args = parser.parse_args()
+
+    url, key = supabase_credentials()
+    dumps_dir = os.getenv("OFFER_DUMPS_DIR", "offers")
+    dumps = OfferCatalogue(load_plan_dumps(dumps_dir)) if os.path.isdir(dumps_dir) else None
+
+    started = time.monotonic()
+    rows = export(connect(url, key), args.out, args.run_date, args.format,
+                  (args.usage_rate, args.daily_supply), not args.no_aws, dumps, args.page_size)
+    print(", ".join(f"{t}: {n:,} rows" for t, n in rows.items())
+          + f" → {args.out} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Long-format retailer offer catalogue.
+
+Offers come from two places: the wide ``competitor_offers`` table (one row per
+village, one column pair per retailer) and local plan dumps such as CDR /
+Energy Made Easy JSON files.  Both are flattened to one row per plan with the
+usage rate in c/kWh and the daily charge in $/day, indexed by distributor,
+postcode and village, and ranked with a vectorized annual cost.  A dump plan
+reaches a village through its ``village_name`` or through the village's
+``distributor``/``postcode`` when ``village_inputs`` has those columns.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from tariff_engine import DAYS, sfloat
+
+# competitor_offers stores <key>_usage_rate (c/kWh) and <key>_daily_charge (c/day)
+RETAILERS = {
+    "agl":      "AGL",
+    "ea":       "EnergyAus",
+    "origin":   "Origin",
+    "alinta":   "Alinta",
+    "momentum": "Momentum",
+    "actewagl": "ActewAGL",
+}
+COLUMNS = ("plan_id", "retailer", "plan_name", "village_name", "distributor", "postcodes",
+           "tariff_type", "customer_type", "effective_from", "effective_to",
+           "usage_rate", "daily_charge", "source")
+
+
+# ───────────────────────────────────────────────────────────────
+# SOURCES
+# ───────────────────────────────────────────────────────────────
+def legacy_offers(row, labels: dict = None, skip_zero: bool = True) -> pd.DataFrame:
+    """Flatten one wide ``competitor_offers`` row; incomplete retailers are skipped.
+
+    ``labels`` overrides retailer display names by key (default ``RETAILERS``).
+    A missing rate always makes a retailer incomplete, a zero one only with
+    ``skip_zero``.
+    """
+    row = row or {}
+    labels = {**RETAILERS, **(labels or {})}
+    given = bool if skip_zero else (lambda v: v is not None)
+    village = str(row.get("village_name") or "").strip() or None
+    records = [{
+        "plan_id":      f"{village}:{key}",
+        "retailer":     label,
+        "plan_name":    label,
+        "village_name": village,
+        "tariff_type":  "SINGLE_RATE",
+        "usage_rate":   sfloat(row[f"{key}_usage_rate"]),
+        "daily_charge": sfloat(row[f"{key}_daily_charge"]) / 100,     # stored as ¢/day
+        "source":       "competitor_offers",
+    } for key, label in labels.items()
+      if given(row.get(f"{key}_usage_rate")) and given(row.get(f"{key}_daily_charge"))]
+    return pd.DataFrame.from_records(records, columns=list(COLUMNS))
+
+
+def _cdr_plan(plan: dict, source: str):
+    """One CDR EnergyPlanDetail as a catalogue record, or ``None`` if it has no prices."""
+    contract = plan.get("electricityContract") or {}
+    periods = contract.get("tariffPeriod") or []
+    if not periods or (plan.get("fuelType") or "ELECTRICITY").upper() == "GAS":
+        return None
+    period = periods[0]
+    blocks = (period.get("singleRate") or {}).get("rates") \
+        or [r for tou in period.get("timeOfUseRates") or [] for r in tou.get("rates") or []]
+    prices = [sfloat(r.get("unitPrice"), None) for r in blocks]
+    prices = [p for p in prices if p is not None]
+    daily = period.get("dailySupplyCharge", period.get("dailySupplyCharges"))
+    if not prices or daily is None:
+        return None
+    geo = plan.get("geography") or {}
+    return {
+        "plan_id":       plan.get("planId"),
+        "retailer":      plan.get("brandName") or plan.get("brand"),
+        "plan_name":     plan.get("displayName") or plan.get("planId"),
+        "distributor":   "|".join(geo.get("distributors") or []) or None,
+        "postcodes":     tuple(str(p).strip() for p in geo.get("includedPostcodes") or []),
+        "tariff_type":   contract.get("pricingModel") or "SINGLE_RATE",
+        "customer_type": plan.get("customerType"),
+        "effective_from": plan.get("effectiveFrom"),
+        "effective_to":  plan.get("effectiveTo"),
+        # CDR prices are $/kWh; time-of-use plans use the mean of their period rates
+        "usage_rate":    float(np.mean(prices)) * 100,
+        "daily_charge":  sfloat(daily),
+        "source":        source,
+    }
+
+
+def _json_plans(doc):
+    """Plan details from a single plan response, a list, or a ``data.plans`` page."""
+    if isinstance(doc, list):
+        for item in doc:
+            yield from _json_plans(item)
+    elif isinstance(doc, dict):
+        data = doc.get("data", doc)
+        if isinstance(data, dict) and "plans" in data:
+            yield from _json_plans(data["plans"])
+        elif isinstance(data, list):
+            yield from _json_plans(data)
+        else:
+            yield data
+
+
+def load_plan_dumps(directory: str) -> pd.DataFrame:
+    """Read every ``*.json`` (CDR plan details) and ``*.csv`` (catalogue columns) under ``directory``."""
+    records, frames = [], []
+    for path in sorted(glob.glob(os.path.join(directory, "**", "*.json"), recursive=True)):
+        with open(path, encoding="utf-8") as fh:
+            doc = json.load(fh)
+        records += [r for r in (_cdr_plan(p, os.path.basename(path)) for p in _json_plans(doc)) if r]
+    for path in sorted(glob.glob(os.path.join(directory, "**", "*.csv"), recursive=True)):
+        df = pd.read_csv(path, dtype={"postcodes": str})
+        df["postcodes"] = df.get("postcodes", pd.Series("", index=df.index)).fillna("").map(
+            lambda s: tuple(p.strip() for p in str(s).split("|") if p.strip()))
+        df["source"] = os.path.basename(path)
+        frames.append(df.reindex(columns=list(COLUMNS)))
+    frames.insert(0, pd.DataFrame.from_records(records, columns=list(COLUMNS)))
+    return pd.concat(frames, ignore_index=True)
+
+
+# ───────────────────────────────────────────────────────────────
+# CATALOGUE
+# ───────────────────────────────────────────────────────────────
+def rank_offers(offers: pd.DataFrame, qty_kwh: float, nmis: float, n: int = None) -> pd.DataFrame:
+    """Annual usage, supply and total cost of each offer, cheapest first."""
+    usage  = qty_kwh * offers["usage_rate"].to_numpy(float) / 100
+    supply = nmis * offers["daily_charge"].to_numpy(float) * DAYS
+    ranked = offers.assign(usage_cost=usage, supply_cost=supply, total_cost=usage + supply)
+    ranked = ranked.sort_values("total_cost", kind="stable")
+    return ranked.head(n) if n else ranked
+
+
+class OfferCatalogue:
+    """Plans indexed by distributor, postcode and village."""
+
+    def __init__(self, plans: pd.DataFrame):
+        plans = plans.reindex(columns=list(COLUMNS)).reset_index(drop=True)
+        plans["postcodes"] = plans["postcodes"].map(lambda p: p if isinstance(p, tuple) else ())
+        for col in ("effective_from", "effective_to"):
+            plans[col] = pd.to_datetime(plans[col], errors="coerce", utc=True)
+        plans = plans[plans["usage_rate"].notna() & plans["daily_charge"].notna()]
+        self.plans = plans.reset_index(drop=True)
+        self._index = {
+            "distributor":  self._build(self.plans["distributor"].map(
+                                lambda d: d.lower().split("|") if isinstance(d, str) else [])),
+            "postcode":     self._build(self.plans["postcodes"]),
+            "village_name": self._build(self.plans["village_name"].map(
+                                lambda v: [v] if isinstance(v, str) else [])),
+        }
+        self._no_postcode = np.flatnonzero(self.plans["postcodes"].map(len).to_numpy() == 0)
+
+    @staticmethod
+    def _build(keys: pd.Series) -> dict:
+        index = {}
+        for pos, ks in enumerate(keys):
+            for k in ks:
+                index.setdefault(k, []).append(pos)
+        return {k: np.asarray(v) for k, v in index.items()}
+
+    def __len__(self):
+        return len(self.plans)
+
+    def lookup(self, distributor=None, postcode=None, on=None, village=None) -> pd.DataFrame:
+        """Plans available for a site; every filter given narrows the result."""
+        pos = np.arange(len(self.plans))
+        if village is not None:
+            pos = np.intersect1d(pos, self._index["village_name"].get(village, []))
+        if distributor is not None:
+            pos = np.intersect1d(pos, self._index["distributor"].get(distributor.lower(), []))
+        if postcode is not None:
+            # Plans without a postcode list cover their whole distributor area
+            area = self._no_postcode if distributor is not None else []
+            pos = np.intersect1d(pos, np.union1d(self._index["postcode"].get(str(postcode).strip(), []), area))
+        out = self.plans.iloc[pos.astype(int)]
+        if on is not None:
+            on = pd.Timestamp(on, tz="UTC") if pd.Timestamp(on).tzinfo is None else pd.Timestamp(on)
+            live = ((out["effective_from"].isna() | (out["effective_from"] <= on))
+                    & (out["effective_to"].isna() | (out["effective_to"] > on)))
+            out = out[live]
+        return out
+
+
+def site_filters(village_row) -> dict:
+    """Catalogue filters for a village from optional ``distributor``/``postcode`` columns."""
+    row = village_row or {}
+    filters = {k: str(row[k]).strip() for k in ("distributor", "postcode") if row.get(k)}
+    return filters or None
+
+
+def site_offers(village: str, offer_row, village_row, dumps: OfferCatalogue = None,
+                on=None) -> pd.DataFrame:
+    """A village's stored competitor offers plus the dump plans tagged with it or covering its site."""
+    offers = legacy_offers(offer_row)
+    if dumps is not None and len(dumps):
+        on = pd.Timestamp.now() if on is None else on
+        plans = dumps.lookup(village=village, on=on)
+        filters = site_filters(village_row)
+        if filters:
+            site = dumps.lookup(on=on, **filters)
+            plans = pd.concat([plans, site[~site.index.isin(plans.index)]])    # tagged and covering
+        offers = pd.concat([offers, plans], ignore_index=True)
+    return offers
+
+
+def village_offers(store, village: str, dumps: OfferCatalogue = None, on=None) -> pd.DataFrame:
+    """``site_offers`` from the store's rows for ``village``."""
+    return site_offers(village, store.row("competitor_offers", village),
+                       store.row("village_inputs", village), dumps, on)
@@ -0,0 +1,81 @@
+"""Multi-year OPEX projection over villages × years × scenarios."""
+import numpy as np
+import pandas as pd
+
+METRICS = ("total_cost", "seene_costs", "usage_rev", "supply_rev", "aws_rev", "total_rev", "opex")
+DRIVERS = ("cost", "tariff", "seene")      # escalated by each scenario, % p.a. as a fraction
+
+
+def wholesale_escalation(w_df: pd.DataFrame, since: int = 2021) -> float:
+    """Annual growth of the mean NEM wholesale price, from a log-linear fit."""
+    yearly = (pd.DataFrame({
+                  "year":  pd.to_numeric(w_df["year"], errors="coerce"),
+                  "price": pd.to_numeric(w_df["average_price"], errors="coerce"),
+              })
+              .dropna()
+              .query("year >= @since and price > 0")
+              .groupby("year")["price"].mean())
+    if len(yearly) < 2:
+        return 0.0
+    slope = np.polyfit(yearly.index.to_numpy(float), np.log(yearly.to_numpy(float)), 1)[0]
+    return float(np.expm1(slope))
+
+
+def default_scenarios(trend: float, custom: dict = None) -> dict:
+    """Built-in scenarios around the wholesale trend, plus an optional custom one."""
+    scenarios = {
+        "Rates held":          {"cost": trend, "tariff": 0.0,   "seene": 0.0},
+        "Rates track market":  {"cost": trend, "tariff": trend, "seene": 0.0},
+        "High market":         {"cost": trend * 2, "tariff": trend, "seene": 0.0},
+    }
+    if custom:
+        scenarios["Custom"] = {k: float(custom.get(k, 0.0)) for k in DRIVERS}
+    return scenarios
+
+
+class Projection:
+    """Result cube of shape (villages, years, scenarios, metrics)."""
+
+    def __init__(self, values, villages, years, scenarios):
+        self.values = values
+        self.villages = list(villages)
+        self.years = list(years)
+        self.scenarios = list(scenarios)
+
+    def series(self, village: str, metric: str = "opex") -> pd.DataFrame:
+        """Years × scenarios table of one metric for one village."""
+        v = self.villages.index(village)
+        return pd.DataFrame(self.values[v, :, :, METRICS.index(metric)],
+                            index=pd.Index(self.years, name="year"), columns=self.scenarios)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Tidy export: one row per (village, year, scenario), one column per metric."""
+        index = pd.MultiIndex.from_product([self.villages, self.years, self.scenarios],
+                                           names=["village", "year", "scenario"])
+        return pd.DataFrame(self.values.reshape(-1, len(METRICS)), index=index,
+                            columns=list(METRICS)).reset_index()
+
+
+def project(base: pd.DataFrame, scenarios: dict, horizon: int = 10,
+            base_year: int = 2024) -> Projection:
+    """Carry each row of ``tariff_engine.village_frame`` forward ``horizon`` years.
+
+    Costs escalate by the scenario's ``cost`` rate, Seene costs by ``seene`` and
+    usage, supply and AWS revenue by ``tariff`` (the AWS fee moves in proportion
+    to the usage and supply charges).
+    """
+    years = np.arange(horizon + 1)
+    rates = np.array([[sc.get(k, 0.0) for k in DRIVERS] for sc in scenarios.values()], dtype=float)
+    growth = (1 + rates[:, :, None]) ** years[None, None, :]      # (S, drivers, Y)
+    g_cost, g_tariff, g_seene = (growth[:, i].T[None] for i in range(len(DRIVERS)))  # (1, Y, S)
+
+    col = lambda c: base[c].to_numpy(float)[:, None, None]
+    cost   = col("total_cost") * g_cost
+    seene  = col("seene_costs") * g_seene
+    usage  = (col("qty_total") * col("u_rate") / 100) * g_tariff
+    supply = col("supply_rev") * g_tariff
+    aws    = col("aws_rev") * g_tariff
+    total  = usage + supply + aws
+    opex   = cost + seene - total
+    values = np.stack([cost, seene, usage, supply, aws, total, opex], axis=-1)
+    return Projection(values, base.index, base_year + years, scenarios)
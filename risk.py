@@ -0,0 +1,175 @@
+"""Seeded Monte Carlo of village OPEX under wholesale price risk.
+
+Price paths are block-bootstrapped from the historical quarterly
+``wholesale_price_nem`` returns (whole quarters are sampled so the states stay
+correlated).  OPEX is linear in the wholesale multiplier, so per-village
+percentiles and shortfall probabilities come straight from each state's sorted
+multipliers instead of a villages × draws matrix.  The draws depend only on
+the price history, draw count and seed, so one ``PriceDraws`` serves every
+rate scenario.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from tariff_engine import DAYS, SUMMARY
+
+POOLED = "ALL"
+CHUNK = 25_000                  # draws per RNG stream; fixed so results don't depend on workers
+PERCENTILES = (10, 50, 90)
+
+norm_state = lambda s: re.sub(r"\d+$", "", s.strip().upper()) if isinstance(s, str) and s.strip() else None
+
+
+def quarterly_log_returns(w_df: pd.DataFrame) -> pd.DataFrame:
+    """Quarter-on-quarter log returns, one column per state plus a pooled ``ALL``."""
+    df = pd.DataFrame({
+        "state":  w_df["state"].map(norm_state),
+        "year":   pd.to_numeric(w_df["year"], errors="coerce"),
+        "q":      pd.to_numeric(w_df["quarter"].astype(str).str.strip().str[-1], errors="coerce"),
+        "price":  pd.to_numeric(w_df["average_price"], errors="coerce"),
+    }).dropna()
+    df = df[df["price"] > 0]
+    prices = df.pivot_table(index=["year", "q"], columns="state", values="price", aggfunc="mean")
+    returns = np.log(prices.sort_index()).diff().iloc[1:]
+    returns[POOLED] = returns.mean(axis=1)
+    # A state missing a quarter follows the pooled market for that quarter
+    returns = returns.apply(lambda c: c.fillna(returns[POOLED])).dropna()
+    return returns
+
+
+def sample_multipliers(returns: pd.DataFrame, draws: int, seed: int = 0,
+                       quarters: int = 4, workers: int = 1) -> np.ndarray:
+    """(draws, states) ratio of next year's average price to today's."""
+    table = returns.to_numpy(float)
+    n_chunks = -(-draws // CHUNK)
+    streams = np.random.SeedSequence(seed).spawn(n_chunks)
+
+    def chunk(i):
+        n = min(CHUNK, draws - i * CHUNK)
+        idx = np.random.default_rng(streams[i]).integers(0, len(table), size=(n, quarters))
+        path = np.exp(np.cumsum(table[idx], axis=1))           # (n, quarters, states)
+        return path.mean(axis=1)
+
+    if workers > 1 and n_chunks > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(chunk, range(n_chunks)))
+    else:
+        parts = [chunk(i) for i in range(n_chunks)]
+    return np.concatenate(parts)
+
+
+class PriceDraws:
+    """Sampled wholesale multipliers per state, sorted and with their percentiles."""
+
+    def __init__(self, w_df: pd.DataFrame, draws: int = 100_000, seed: int = 0, workers: int = None):
+        returns = quarterly_log_returns(w_df)
+        if returns.empty:
+            raise ValueError("Not enough wholesale price history to sample from")
+        self.states = list(returns.columns)
+        self.multipliers = sample_multipliers(returns, draws, seed, workers=workers or os.cpu_count() or 1)
+        self.sorted = np.sort(self.multipliers, axis=0)
+        self.quantiles = np.percentile(self.multipliers, PERCENTILES, axis=0)    # (percentiles, states)
+
+
+class RiskResult:
+    """Per-village P10/P50/P90 OPEX and shortfall probability for each revenue case.
+
+    Holds no draws itself, so it stays small; ``opex_draws`` takes the
+    ``PriceDraws`` it was simulated from.
+    """
+
+    def __init__(self, table, state_idx, state_exposure, coeffs):
+        self.table = table
+        self._state_idx = state_idx
+        self._state_exposure = state_exposure
+        self._coeffs = coeffs            # case -> (a, b, budget) per row
+
+    def opex_draws(self, village: str, prices: PriceDraws, case: str = "current") -> np.ndarray:
+        """Simulated OPEX of one row, one value per draw."""
+        a, b, _ = self._coeffs[case]
+        i = self.table.index.get_loc(village)
+        s = self._state_idx[i]
+        if s < 0:                        # portfolio row: exposure split by state
+            return prices.multipliers @ self._state_exposure + b[i]
+        return a[i] * prices.multipliers[:, s] + b[i]
+
+
+def simulate(base: pd.DataFrame, w_df: pd.DataFrame, draws: int = 100_000, seed: int = 0,
+             wholesale_share: float = 0.4, sim_rate=None, budget=None, headroom: float = 0.0,
+             workers: int = None, prices: PriceDraws = None) -> RiskResult:
+    """Run the Monte Carlo over every row of ``tariff_engine.village_frame``.
+
+    ``wholesale_share`` is the part of ``total_cost`` that moves with wholesale
+    prices.  ``sim_rate`` (c/kWh, $/day) adds a "simulated" case using the
+    sidebar rates.  Shortfall is the chance OPEX ends up above ``budget`` (per
+    row or scalar), which defaults to the current OPEX Budget plus
+    ``headroom`` × its size.  Both cases share that budget, so the simulated
+    case shows whether the candidate rates keep OPEX within it.
+    ``prices`` reuses draws already sampled from ``w_df``; ``draws`` and
+    ``seed`` are then ignored.
+    """
+    prices = prices or PriceDraws(w_df, draws, seed, workers)
+    states, M, M_sorted, Q = prices.states, prices.multipliers, prices.sorted, prices.quantiles
+    draws = len(M)
+
+    is_summary = (base.index == SUMMARY)
+    col = lambda c: base[c].to_numpy(float)
+    si = np.array([states.index(s) if s in states else states.index(POOLED)
+                   for s in base["state"].map(norm_state)], dtype=int)
+    si[is_summary] = -1
+
+    # Portfolio exposure per state: Σ share × cost of the villages in that state
+    village_exposure = wholesale_share * col("total_cost") * ~is_summary
+    state_exposure = np.bincount(np.where(si >= 0, si, 0), weights=village_exposure,
+                                 minlength=len(states))
+
+    revenue = {"current": col("qty_total") * col("u_rate") / 100 + col("supply_rev") + col("aws_rev")}
+    if sim_rate is not None:
+        u, d = sim_rate
+        ratio = np.divide(u, col("u_rate"), out=np.ones(len(base)), where=col("u_rate") != 0)
+        revenue["simulated"] = (col("qty_total") * u / 100 + col("nmi_total") * d * DAYS
+                                + col("aws_rev") * ratio)
+
+    if budget is None:
+        opex = col("total_cost") + col("seene_costs") - revenue["current"]
+        budget = opex + headroom * np.abs(opex)
+    cap = np.broadcast_to(np.asarray(budget, float), len(base))
+
+    table = pd.DataFrame(index=base.index)
+    table["state"] = [states[i] if i >= 0 else "portfolio" for i in si]
+    table["budget"] = cap
+    coeffs = {}
+    for case, rev in revenue.items():
+        a = wholesale_share * col("total_cost")
+        b = (1 - wholesale_share) * col("total_cost") + col("seene_costs") - rev
+
+        # OPEX = a·m + b is monotone in m, so its percentiles are the multiplier's
+        lo, hi = Q[:, np.maximum(si, 0)], Q[::-1, np.maximum(si, 0)]
+        pct = np.where(a >= 0, a * lo + b, a * hi + b)         # (percentiles, rows)
+
+        shortfall = np.empty(len(base))
+        for s in range(len(states)):
+            rows = np.flatnonzero(si == s)
+            if not len(rows):
+                continue
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = (cap[rows] - b[rows]) / a[rows]
+            above = 1 - np.searchsorted(M_sorted[:, s], t, side="right") / draws
+            below = np.searchsorted(M_sorted[:, s], t, side="left") / draws
+            shortfall[rows] = np.where(a[rows] > 0, above,
+                              np.where(a[rows] < 0, below, (b[rows] > cap[rows]).astype(float)))
+
+        for i in np.flatnonzero(si < 0):
+            dist = M @ state_exposure + b[i]
+            pct[:, i] = np.percentile(dist, PERCENTILES)
+            shortfall[i] = np.mean(dist > cap[i])
+        coeffs[case] = (a, b, cap)
+
+        for p, values in zip(PERCENTILES, pct):
+            table[f"{case}_p{p}"] = values
+        table[f"{case}_shortfall"] = shortfall
+    return RiskResult(table, si, state_exposure, coeffs)
@@ -0,0 +1,59 @@
+"""Process-wide LRU of scenario results shared by every session.
+
+Analysts tend to try the same few candidate rates on the same villages, so
+the simulated figures, waterfall, Monte Carlo, sensitivity, projection and
+solar results for a (village, usage rate, daily charge, AWS toggle) scenario
+are computed once and reused.  Rates are quantized to the sidebar step sizes
+and the key includes the village's data digest, so a data change simply stops
+matching the old entries.
+"""
+import threading
+from collections import OrderedDict
+
+USAGE_STEP = 0.01       # c/kWh, sidebar step
+DAILY_STEP = 0.0001     # $/day, sidebar step
+
+
+def quantize(usage_rate: float, daily: float) -> tuple:
+    """Rates snapped to the sidebar step sizes (as floats, so 27 and 27.000001 share a key)."""
+    return (round(round(float(usage_rate) / USAGE_STEP) * USAGE_STEP, 2),
+            round(round(float(daily) / DAILY_STEP) * DAILY_STEP, 4))
+
+
+class ScenarioCache:
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = self.misses = 0
+
+    def key(self, kind: str, store, village: str, usage_rate: float, daily: float,
+            include_aws: bool, *params) -> tuple:
+        """Entry key; ``params`` are any further hashable inputs of ``kind`` (draws, horizon…)."""
+        return (kind, village, store.digest(village), *quantize(usage_rate, daily), bool(include_aws),
+                *params)
+
+    def get(self, key, compute):
+        """Cached ``compute()`` for ``key``; least recently used entries are evicted first."""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._items), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,68 @@
+"""One-at-a-time OPEX sensitivity (tornado) for every village in one batch."""
+import numpy as np
+import pandas as pd
+
+from tariff_engine import DAYS
+
+DRIVERS = {
+    "usage_rate":   "Usage rate (c/kWh)",
+    "daily_supply": "Daily supply ($/day)",
+    "aws_fee":      "AWS service fee",
+    "seene_costs":  "Seene costs",
+    "total_cost":   "Total cost",
+    "consumption":  "Consumption (kWh)",
+}
+
+
+class Sensitivity:
+    """Simulated OPEX for each row under the base case and each driver's low/high swing."""
+
+    def __init__(self, opex, rows, swings):
+        self.opex = opex                  # (rows, 1 + 2 × drivers)
+        self.rows = list(rows)
+        self.swings = swings
+
+    def table(self, row: str) -> pd.DataFrame:
+        """Per-driver OPEX impact for one row, largest swing first."""
+        o = self.opex[self.rows.index(row)]
+        low, high = o[1::2], o[2::2]
+        df = pd.DataFrame({
+            "Swing":        [f"±{self.swings[k] * 100:.0f}%" for k in DRIVERS],
+            "Low OPEX":     low,
+            "High OPEX":    high,
+            "Δ Low":        low - o[0],
+            "Δ High":       high - o[0],
+        }, index=pd.Index(DRIVERS.values(), name="Driver"))
+        df["Range"] = (df["Δ High"] - df["Δ Low"]).abs()
+        return df.sort_values("Range", ascending=False)
+
+    def base(self, row: str) -> float:
+        return float(self.opex[self.rows.index(row), 0])
+
+
+def run(base: pd.DataFrame, sim_rate, swings=0.1) -> Sensitivity:
+    """Perturb every driver of ``tariff_engine.village_frame`` rows by ±``swings``.
+
+    ``sim_rate`` is the (c/kWh, $/day) being assessed; ``swings`` is one
+    fraction for every driver or a dict of per-driver fractions.  All rows and
+    cases are evaluated in a single (rows × cases × drivers) array.
+    """
+    if not isinstance(swings, dict):
+        swings = dict.fromkeys(DRIVERS, float(swings))
+    swings = {k: float(swings.get(k, 0.0)) for k in DRIVERS}
+    n = len(base)
+    col = lambda c: base[c].to_numpy(float)
+
+    X = np.column_stack([np.full(n, float(sim_rate[0])), np.full(n, float(sim_rate[1])),
+                         col("aws_rev"), col("seene_costs"), col("total_cost"), col("qty_total")])
+    F = np.ones((1 + 2 * len(DRIVERS), len(DRIVERS)))
+    for i, k in enumerate(DRIVERS):
+        F[1 + 2 * i, i] = 1 - swings[k]
+        F[2 + 2 * i, i] = 1 + swings[k]
+    u, d, aws, seene, cost, qty = np.moveaxis(X[:, None, :] * F[None], -1, 0)   # each (rows, cases)
+
+    # AWS fee follows the usage rate relative to the stored tariff, as on the OPEX page
+    u_village = col("u_rate")[:, None]
+    ratio = np.divide(u, u_village, out=np.ones_like(u), where=u_village != 0)
+    revenue = qty * u / 100 + col("nmi_total")[:, None] * d * DAYS + aws * ratio
+    return Sensitivity(cost + seene - revenue, base.index, swings)
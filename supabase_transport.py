@@ -0,0 +1,220 @@
+"""Resilient transport in front of the Supabase PostgREST client.
+
+``connect()`` returns a drop-in replacement for the Supabase client as far as
+``client.table(...)....execute()`` is concerned.  One client (and so one
+keep-alive HTTP connection pool) is shared by every caller; each query gets a
+timeout, bounded retries with jittered exponential backoff and goes through a
+circuit breaker.  While the breaker is open, or once retries run out, queries
+are answered from the last good local snapshot of the same query.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as QueryTimeout
+
+import httpx
+from supabase import ClientOptions, create_client
+
+# Only whole-table reads are snapshotted: they are what a cold start needs, and
+# filtered or paged reads would add a snapshot per distinct filter value or page
+SNAPSHOT_CALLS = {"select", "order"}
+
+log = logging.getLogger(__name__)
+
+
+class CircuitOpen(RuntimeError):
+    """Raised when the backend is marked down and no snapshot can stand in."""
+
+
+class CircuitBreaker:
+    """Closed → open after ``failure_threshold`` consecutive failures; one probe after ``reset_after`` s."""
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if self._probing else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_after:
+                self._probing = True            # let exactly one request test the backend
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class SnapshotStore:
+    """Last good result per query, in memory and (optionally) as JSON files."""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+        self._memory = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(table: str, calls) -> str:
+        return hashlib.sha1(repr((table, calls)).encode()).hexdigest()
+
+    def save(self, key: str, data):
+        self._memory[key] = data
+        if self.directory:
+            path = os.path.join(self.directory, f"{key}.json")
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump(data, fh, default=str)
+                os.replace(tmp, path)
+            except OSError as e:
+                log.warning("Could not write snapshot %s: %s", path, e)
+
+    def load(self, key: str):
+        if key in self._memory:
+            return self._memory[key]
+        if self.directory:
+            try:
+                with open(os.path.join(self.directory, f"{key}.json"), encoding="utf-8") as fh:
+                    return json.load(fh)
+            except (OSError, ValueError):
+                pass
+        return None
+
+
+class Response:
+    def __init__(self, data, stale: bool = False):
+        self.data = data
+        self.stale = stale
+
+
+class _Query:
+    """Records a PostgREST builder chain so it can be replayed (and retried) on ``execute()``."""
+
+    def __init__(self, transport, table: str, calls: tuple = ()):
+        self._transport = transport
+        self._table = table
+        self._calls = calls
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def chain(*args, **kwargs):
+            call = (name, args, tuple(sorted(kwargs.items())))
+            return _Query(self._transport, self._table, self._calls + (call,))
+        return chain
+
+    def execute(self) -> Response:
+        return self._transport.execute(self._table, self._calls)
+
+
+class ResilientClient:
+    def __init__(self, client, timeout: float = 10.0, retries: int = 2, backoff: float = 0.25,
+                 max_backoff: float = 4.0, breaker: CircuitBreaker = None,
+                 snapshots: SnapshotStore = None, max_workers: int = 16):
+        self._client = client
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.snapshots = snapshots or SnapshotStore()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+        self.degraded = False             # last answer came from a snapshot
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def _run(self, table: str, calls):
+        builder = self._client.table(table)
+        for name, args, kwargs in calls:
+            builder = getattr(builder, name)(*args, **dict(kwargs))
+        return builder.execute().data
+
+    def execute(self, table: str, calls) -> Response:
+        snapshot = all(name in SNAPSHOT_CALLS for name, _, _ in calls)
+        key = SnapshotStore.key(table, calls)
+        if not self.breaker.allow():
+            return self._fallback(key, snapshot, CircuitOpen(f"Supabase circuit open ({table})"))
+
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                data = self._pool.submit(self._run, table, calls).result(timeout=self.timeout)
+            except QueryTimeout:
+                error = QueryTimeout(f"{table} query timed out after {self.timeout:.0f}s")
+            except Exception as e:
+                error = e
+            else:
+                self.breaker.record_success()
+                self.degraded = False
+                if snapshot:
+                    self.snapshots.save(key, data)
+                return Response(data)
+            self.breaker.record_failure()
+            if attempt == self.retries or self.breaker.state != "closed":
+                break
+            # Full jitter keeps retrying sessions from stampeding a recovering backend
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+        return self._fallback(key, snapshot, error)
+
+    def _fallback(self, key: str, snapshot: bool, error: Exception) -> Response:
+        data = self.snapshots.load(key) if snapshot else None
+        if data is None:
+            raise error
+        self.degraded = True
+        return Response(data, stale=True)
+
+
+def client_options(timeout: float, pool_size: int) -> ClientOptions:
+    """Keep-alive pooled HTTP client where this supabase-py lets us pass one in."""
+    if "httpx_client" not in getattr(ClientOptions, "__dataclass_fields__", {}):
+        return ClientOptions(postgrest_client_timeout=timeout)
+    http = httpx.Client(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                            keepalive_expiry=60.0),
+        follow_redirects=True,
+    )
+    return ClientOptions(postgrest_client_timeout=timeout, httpx_client=http)
+
+
+def connect(url: str, key: str, timeout: float = None, retries: int = None,
+            snapshot_dir: str = None, pool_size: int = 16) -> ResilientClient:
+    """Create the shared Supabase client behind a ``ResilientClient``.
+
+    Defaults come from ``SUPABASE_TIMEOUT`` (s), ``SUPABASE_RETRIES`` and
+    ``SUPABASE_SNAPSHOT_DIR``.
+    """
+    timeout = timeout if timeout is not None else float(os.getenv("SUPABASE_TIMEOUT", "10"))
+    retries = retries if retries is not None else int(os.getenv("SUPABASE_RETRIES", "2"))
+    snapshot_dir = snapshot_dir or os.getenv("SUPABASE_SNAPSHOT_DIR", ".snapshots")
+    client = create_client(url, key, options=client_options(timeout, pool_size))
+    return ResilientClient(client, timeout=timeout, retries=retries,
+                           snapshots=SnapshotStore(snapshot_dir), max_workers=pool_size)
@@ -0,0 +1,257 @@
+"""Local HTTP JSON API over the tariff engine.
+
+Serves the numbers the Streamlit pages show, using the same ``tariff_engine``
+math, to other internal systems (billing, board packs):
+
+    GET /health
+    GET /villages
+    GET /villages/<name>                 current vs simulated revenue and OPEX
+    GET /villages/<name>/competitors     offers ranked against the village tariff
+    GET /villages/<name>/unbilled        unbilled gate cost allocation
+    GET /portfolio                       "Summary of All Villages" figures
+    GET /portfolio/villages              current vs simulated OPEX for every village
+
+Simulation rates come from ``usage_rate`` (c/kWh), ``daily_supply`` ($/day)
+and ``aws`` (1/0) query parameters.  Responses are cached per data version and
+carry an ETag, so unchanged data is answered with ``304 Not Modified``.
+
+Run with ``python tariff_api.py --port 8080``.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from offer_catalogue import OfferCatalogue, load_plan_dumps, rank_offers, village_offers
+from supabase_transport import connect
+from tariff_engine import (DEFAULT_RATE, PortfolioAggregate, proposed_rate, stored_rate,
+                           supabase_credentials, unbilled_allocation, village_financials, village_totals)
+from village_sync import PORTFOLIO, VillageStore
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _clean(value):
+    """JSON-safe copy: NaN/inf become null."""
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+class ResponseCache:
+    """Size-bounded LRU of encoded responses keyed by request and data version."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+class TariffService:
+    def __init__(self, store: VillageStore, portfolio: PortfolioAggregate,
+                 offers: OfferCatalogue = None):
+        self.store = store
+        self.portfolio = portfolio
+        self.offers = offers
+        self.cache = ResponseCache()
+
+    # ── parameters ────────────────────────────────────────────────
+    @staticmethod
+    def _float(params, name, default):
+        try:
+            return float(params[name][0]) if name in params else default
+        except ValueError:
+            raise ApiError(400, f"'{name}' must be a number")
+
+    def _sim(self, params):
+        return (self._float(params, "usage_rate", DEFAULT_RATE[0]),
+                self._float(params, "daily_supply", DEFAULT_RATE[1]),
+                params.get("aws", ["1"])[0].lower() not in ("0", "false", "no"))
+
+    def _village(self, name):
+        if not self.store.rows("village_inputs", name):
+            raise ApiError(404, f"Unknown village '{name}'")
+        return name
+
+    def _rate(self, name, sim):
+        return stored_rate(self.store.rows("en_tariffs", name)) or sim[:2]
+
+    # ── endpoints ─────────────────────────────────────────────────
+    def village(self, name, params):
+        sim = self._sim(params)
+        totals = self.store.derived(name, "totals",
+                                    lambda: village_totals(self.store.rows("village_inputs", name)))
+        u, d = self._rate(name, sim)
+        return {"village": name, "totals": totals,
+                **village_financials(totals, u, d, *sim)}
+
+    def competitors(self, name, params):
+        sim = self._sim(params)
+        fin = self.village(name, params)
+        v_total = fin["current"]["total_rev"]
+        t = fin["totals"]
+        ranked = rank_offers(village_offers(self.store, name, self.offers),
+                             t["qty_total"], t["nmi_total"])
+        ranked = ranked.assign(delta_pct=(ranked["total_cost"] - v_total) / v_total * 100
+                               if v_total else float("nan"))
+        cols = ["retailer", "plan_name", "plan_id", "source", "usage_rate", "daily_charge",
+                "usage_cost", "supply_cost", "total_cost", "delta_pct"]
+        return {"village": name, "village_total": v_total, "include_aws": sim[2],
+                "offers": ranked[cols].astype(object).where(ranked[cols].notna(), None)
+                                      .to_dict("records")}
+
+    def unbilled(self, name, params):
+        row = self.store.row("village_inputs", name)
+        u, d = proposed_rate(row)
+        u = self._float(params, "usage_rate", u)
+        d = self._float(params, "daily_supply", d)
+        return {"village": name, **unbilled_allocation(row, u, d)}
+
+    def portfolio_summary(self, params):
+        sim = self._sim(params)
+        totals = self.portfolio.summary()
+        u, d = ((totals["avg_u_rate"], totals["avg_d_daily"])
+                if totals["avg_u_rate"] is not None else sim[:2])
+        return {"totals": totals, **village_financials(totals, u, d, *sim)}
+
+    def portfolio_villages(self, params):
+        sim = self._sim(params)
+        out = []
+        for name, totals in sorted(self.portfolio.contributions().items()):
+            u, d = self._rate(name, sim)
+            fin = village_financials(totals, u, d, *sim)
+            out.append({"village": name,
+                        "current_opex": fin["current"]["opex"],
+                        "simulated_opex": fin["simulated"]["opex"],
+                        "current_total_rev": fin["current"]["total_rev"],
+                        "simulated_total_rev": fin["simulated"]["total_rev"]})
+        return {"villages": out}
+
+    # ── routing ───────────────────────────────────────────────────
+    def resolve(self, path: str, params: dict):
+        """(version key, handler) for a request path."""
+        parts = [unquote(p) for p in path.strip("/").split("/") if p]
+        if parts == ["health"]:
+            return None, lambda: {"status": "ok", "generation": self.store.generation}
+        if parts == ["villages"]:
+            return self.store.generation, lambda: {"villages": self.store.villages()}
+        if parts == ["portfolio"]:
+            return self.store.digest(PORTFOLIO), lambda: self.portfolio_summary(params)
+        if parts == ["portfolio", "villages"]:
+            return self.store.digest(PORTFOLIO), lambda: self.portfolio_villages(params)
+        if parts and parts[0] == "villages" and len(parts) in (2, 3):
+            name = self._village(parts[1])
+            if len(parts) == 2:
+                handler = self.village
+            else:
+                handler = {"competitors": self.competitors, "unbilled": self.unbilled}.get(parts[2])
+            if handler:
+                return self.store.digest(name), lambda: handler(name, params)
+        raise ApiError(404, f"No route for {path}")
+
+    def respond(self, path: str, query: str):
+        """(status, etag, body bytes) for a GET, served from cache when the data is unchanged."""
+        params = parse_qs(query)
+        version, handler = self.resolve(path, params)
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in params.items())), version)
+        hit = self.cache.get(key) if version is not None else None
+        if hit:
+            return (200, *hit)
+        body = json.dumps(_clean(handler()), default=str).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        if version is not None:
+            self.cache.put(key, (etag, body))
+        return 200, etag, body
+
+
+def make_handler(service: TariffService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"           # keep-alive for busy clients
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            try:
+                status, etag, body = service.respond(url.path, url.query)
+            except ApiError as e:
+                status, etag, body = e.status, None, json.dumps({"error": str(e)}).encode()
+            except Exception as e:
+                status, etag, body = 500, None, json.dumps({"error": repr(e)}).encode()
+            if etag and etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-cache")
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass                                 # per-request logging costs more than the request
+
+    return Handler
+
+
+def build_service(poll_interval: float = 30.0) -> TariffService:
+    url, key = supabase_credentials()
+    store = VillageStore(connect(url, key), poll_interval=poll_interval)
+    portfolio = PortfolioAggregate.track(store)
+    dumps = os.getenv("OFFER_DUMPS_DIR", "offers")
+    offers = OfferCatalogue(load_plan_dumps(dumps)) if os.path.isdir(dumps) else None
+    store.refresh(force=True)
+    store.start_polling()
+    return TariffService(store, portfolio, offers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--poll", type=float, default=float(os.getenv("VILLAGE_POLL_SECONDS", "30")),
+                        help="seconds between change-detection polls")
+    args = parser.parse_args()
+
+    service = build_service(args.poll)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"Tariff API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
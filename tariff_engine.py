@@ -0,0 +1,287 @@
+"""Shared tariff math for the Streamlit apps and the tooling around them."""
+import os
+import re
+import threading
+
+import pandas as pd
+from dotenv import load_dotenv
+
+DAYS = 365
+AWS_REVENUE = 56_880        # fixed p.a.
+SEENE_COSTS = 54_360        # fixed platform cost
+SUMMARY = "Summary of All Villages"
+GST = 1.10
+DEFAULT_RATE = (20.0, 1.0)  # sidebar simulation rate (c/kWh, $/day); also stands in for missing tariffs
+money   = lambda x: f"${x:,.0f}"
+sfloat  = lambda x, d=0.0: float(x) if (isinstance(x, (int, float)) or str(x).replace('.', '', 1).isdigit()) else d
+
+QUARTER_COL = re.compile(r"q[1-4]_(usage|supply)_(res|common)")
+TOTAL_FIELDS = ("res_kwh", "com_kwh", "res_supply", "com_supply",
+                "site_kwh", "nmi_total", "village_total_cost", "n_villages")
+FRAME_COLS = ("total_cost", "qty_total", "site_kwh", "res_kwh", "supply_rev", "nmi_total",
+              "u_rate", "d_daily", "seene_costs", "aws_rev", "state")
+
+
+# ───────────────────────────────────────────────────────────────
+# VILLAGE TOTALS
+# ───────────────────────────────────────────────────────────────
+def raw_totals(rows) -> dict:
+    """Sum the quarterly usage/supply columns and site totals of ``village_inputs`` rows."""
+    t = dict.fromkeys(TOTAL_FIELDS, 0.0)
+    t["nmi_total"] = 0
+    for row in rows:
+        for col, val in row.items():
+            m = QUARTER_COL.match(col.lower())
+            if not m: continue
+            kind, area = m.groups()
+            key = ("res_" if area == "res" else "com_") + ("kwh" if kind == "usage" else "supply")
+            t[key] += sfloat(val)
+        t["site_kwh"]           += sfloat(row.get("total_usage_kwh", 0))
+        t["nmi_total"]          += int(sfloat(row.get("nmis_res", 0))) + int(sfloat(row.get("nmis_common", 0)))
+        t["village_total_cost"] += sfloat(row.get("total_cost", 0))
+    t["n_villages"] = len(rows)
+    return t
+
+
+def finish_totals(t: dict) -> dict:
+    """Add the derived fields the pages use on top of ``raw_totals``."""
+    t = dict(t)
+    t["qty_total"] = t["res_kwh"] + t["com_kwh"]
+    # If site_kwh is zero, use the sum of res_kwh and com_kwh
+    t["site_kwh"] = t["site_kwh"] or t["qty_total"]
+    return t
+
+
+def village_totals(rows) -> dict:
+    return finish_totals(raw_totals(rows))
+
+
+def safe_float(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def valid_tariffs(tariffs) -> list:
+    return [t for t in tariffs if t.get("_usage") and t.get("_supply")]
+
+
+# ───────────────────────────────────────────────────────────────
+# REVENUE & OPEX
+# ───────────────────────────────────────────────────────────────
+def village_financials(t: dict, u_rate: float, d_daily: float, sim_u_rate: float,
+                       sim_d_daily: float, include_aws: bool = True) -> dict:
+    """Current and simulated revenue and OPEX Budget, as on the Village Operation tab.
+
+    ``t`` is a ``village_totals``/``PortfolioAggregate.summary`` dict, ``u_rate``
+    and ``d_daily`` the stored tariff and ``sim_*`` the candidate rates.
+    """
+    aws = AWS_REVENUE if include_aws else 0
+
+    # Current
+    usage_rev  = t["qty_total"] * u_rate / 100
+    supply_rev = t["res_supply"] + t["com_supply"]
+    current = {
+        "total_cost":   t["village_total_cost"],
+        "seene_costs":  SEENE_COSTS,
+        "usage_rev":    usage_rev,
+        "supply_rev":   supply_rev,
+        "aws_rev":      aws,
+        "total_rev":    usage_rev + supply_rev + aws,
+        "opex":         t["village_total_cost"] + SEENE_COSTS - (usage_rev + supply_rev + aws),
+        "usage_rate":   u_rate,
+        "daily_supply": d_daily,
+    }
+
+    # Simulated
+    usage_rev  = t["qty_total"] * sim_u_rate / 100
+    supply_rev = t["nmi_total"] * sim_d_daily * DAYS
+    sim_aws    = aws * (sim_u_rate / u_rate if u_rate else 1)
+    simulated = {
+        "total_cost":   t["village_total_cost"],
+        "seene_costs":  SEENE_COSTS,
+        "usage_rev":    usage_rev,
+        "supply_rev":   supply_rev,
+        "aws_rev":      sim_aws,
+        "total_rev":    usage_rev + supply_rev + sim_aws,
+        "opex":         t["village_total_cost"] + SEENE_COSTS - (usage_rev + supply_rev + sim_aws),
+        "usage_rate":   sim_u_rate,
+        "daily_supply": sim_d_daily,
+    }
+    return {"current": current, "simulated": simulated}
+
+
+def proposed_rate(row) -> tuple:
+    """The village's proposed (c/kWh, $/day) from ``village_inputs``, as the Brighton app reads it."""
+    row = row or {}
+    return (safe_float(row.get("proposed_usage_c_per_kwh", 20.0)),
+            safe_float(row.get("proposed_daily_c", 100.0)) / 100.0)
+
+
+def unbilled_allocation(row, usage_rate: float, daily_supply: float) -> dict:
+    """Billed revenue (incl. GST), unmetered usage and the unbilled gate cost per residential NMI."""
+    row = row or {}
+    gate_kwh   = safe_float(row.get("total_usage_kwh"))
+    resi_kwh   = safe_float(row.get("child_billed_kwh"))
+    common_kwh = safe_float(row.get("total_usage_common"))
+    nmis_res   = safe_float(row.get("nmis_res"))
+    nmis_com   = safe_float(row.get("nmis_common"))
+    site_cost  = safe_float(row.get("total_cost"))
+
+    resi_usage_rev   = usage_rate / 100.0 * resi_kwh
+    resi_supply_rev  = daily_supply * nmis_res * DAYS
+    common_usage_rev  = usage_rate / 100.0 * common_kwh
+    common_supply_rev = daily_supply * nmis_com * DAYS
+    total_res    = (resi_usage_rev + resi_supply_rev) * GST
+    total_common = (common_usage_rev + common_supply_rev) * GST
+
+    unbilled = site_cost - (total_res + total_common)
+    per_nmi_annual = unbilled / nmis_res if nmis_res else 0
+    return {
+        "usage_rate":               usage_rate,
+        "daily_supply":             daily_supply,
+        "resi_usage_rev":           resi_usage_rev,
+        "resi_supply_rev":          resi_supply_rev,
+        "total_res":                total_res,
+        "common_usage_rev":         common_usage_rev,
+        "common_supply_rev":        common_supply_rev,
+        "total_common":             total_common,
+        "unmetered_usage_kwh":      max(0.0, gate_kwh - (resi_kwh + common_kwh)),
+        "unbilled_cost":            unbilled,
+        "unbilled_per_res_nmi_annual": per_nmi_annual,
+        "unbilled_per_res_nmi_daily":  per_nmi_annual / DAYS,
+        "unrecovered_cost":         unbilled,
+    }
+
+
+# ───────────────────────────────────────────────────────────────
+# PORTFOLIO AGGREGATE
+# ───────────────────────────────────────────────────────────────
+class PortfolioAggregate:
+    """Materialized "Summary of All Villages" totals, maintained by delta.
+
+    Each village's contribution is remembered so an edit only subtracts the
+    old contribution and adds the new one; ``summary()`` is O(1).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contrib = {}                 # village -> (raw totals, Σ usage, Σ supply $/day, n tariffs)
+        self._sums = dict.fromkeys(TOTAL_FIELDS, 0.0)
+        self._tariff = [0.0, 0.0, 0]
+
+    @classmethod
+    def track(cls, store) -> "PortfolioAggregate":
+        """Build from a ``VillageStore`` snapshot and keep it updated on every sync."""
+        agg = cls()
+        for name in set(store.villages()) | set(store.villages("en_tariffs")):
+            agg.update(name, store.rows("village_inputs", name), store.rows("en_tariffs", name))
+        store.subscribe(lambda changed: [
+            agg.update(name, store.rows("village_inputs", name), store.rows("en_tariffs", name))
+            for name in changed
+        ], before_invalidate=True)
+        return agg
+
+    def update(self, village: str, rows, tariffs):
+        totals = raw_totals(rows)
+        valid = valid_tariffs(tariffs)
+        tariff = (sum(sfloat(t["_usage"]) for t in valid),
+                  sum(sfloat(t["_supply"]) / 100 for t in valid),
+                  len(valid))
+        with self._lock:
+            old = self._contrib.pop(village, None)
+            if old:
+                self._apply(old, -1)
+            if rows or valid:
+                new = (totals, *tariff)
+                self._contrib[village] = new
+                self._apply(new, +1)
+
+    def _apply(self, contrib, sign):
+        totals, u_sum, d_sum, n = contrib
+        for k in TOTAL_FIELDS:
+            self._sums[k] += sign * totals[k]
+        self._tariff[0] += sign * u_sum
+        self._tariff[1] += sign * d_sum
+        self._tariff[2] += sign * n
+
+    def summary(self) -> dict:
+        """Portfolio totals plus average stored rates (``None`` without tariffs)."""
+        with self._lock:
+            t = finish_totals(self._sums)
+            u_sum, d_sum, n = self._tariff
+        t["nmi_total"]  = int(round(t["nmi_total"]))
+        t["n_villages"] = int(round(t["n_villages"]))
+        t["avg_u_rate"]  = u_sum / n if n else None
+        t["avg_d_daily"] = d_sum / n if n else None
+        return t
+
+    def contributions(self) -> dict:
+        """Per-village finished totals, for batch computations over the portfolio."""
+        with self._lock:
+            return {v: finish_totals(c[0]) for v, c in self._contrib.items() if c[0]["n_villages"]}
+
+
+# ───────────────────────────────────────────────────────────────
+# BATCH INPUTS
+# ───────────────────────────────────────────────────────────────
+def stored_rate(tariffs):
+    """(c/kWh, $/day) from a village's first ``en_tariffs`` row, or ``None``."""
+    if tariffs and tariffs[0].get("_usage") and tariffs[0].get("_supply"):
+        return sfloat(tariffs[0]["_usage"]), sfloat(tariffs[0]["_supply"]) / 100
+    return None
+
+
+def village_frame(store, portfolio, include_aws=True, default_rate=DEFAULT_RATE,
+                  with_summary=True) -> pd.DataFrame:
+    """One row per village (plus the portfolio summary) of the current-year inputs.
+
+    Columns are what the vectorized engines need: ``total_cost``, ``qty_total``,
+    ``site_kwh``, ``res_kwh``, ``supply_rev``, ``nmi_total``, ``u_rate``,
+    ``d_daily``, ``seene_costs``, ``aws_rev`` and ``state`` (``None`` when
+    ``village_inputs`` has no state column).  Villages without a stored tariff
+    fall back to ``default_rate`` as the pages do.
+    """
+    aws = AWS_REVENUE if include_aws else 0
+    records = {}
+    for name, t in portfolio.contributions().items():
+        rate = stored_rate(store.rows("en_tariffs", name)) or default_rate
+        inputs = store.row("village_inputs", name) or {}
+        records[name] = (t, rate, inputs.get("state"))
+    if with_summary:
+        t = portfolio.summary()
+        rate = (t["avg_u_rate"], t["avg_d_daily"]) if t["avg_u_rate"] is not None else default_rate
+        records[SUMMARY] = (t, rate, None)
+    df = pd.DataFrame.from_dict({
+        name: {
+            "total_cost":  t["village_total_cost"],
+            "qty_total":   t["qty_total"],
+            "site_kwh":    t["site_kwh"],
+            "res_kwh":     t["res_kwh"],
+            "supply_rev":  t["res_supply"] + t["com_supply"],
+            "nmi_total":   t["nmi_total"],
+            "u_rate":      rate[0],
+            "d_daily":     rate[1],
+            "seene_costs": SEENE_COSTS,
+            "aws_rev":     aws,
+            "state":       str(state).strip().upper() if state else None,
+        }
+        for name, (t, rate, state) in records.items()
+    }, orient="index").reindex(columns=list(FRAME_COLS))
+    df.index.name = "village"
+    return df
+
+
+# ───────────────────────────────────────────────────────────────
+# CONFIGURATION
+# ───────────────────────────────────────────────────────────────
+def supabase_credentials() -> tuple:
+    """``SUPABASE_URL`` and ``SUPABASE_KEY`` from the environment or the ``.env`` beside this file."""
+    env_path = os.path.join(os.path.dirname(__file__), '.env')
+    if os.path.exists(env_path):
+        load_dotenv(dotenv_path=env_path)
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise SystemExit("Set SUPABASE_URL and SUPABASE_KEY (or add them to .env)")
+    return url, key
@@ -0,0 +1,481 @@
+"""Chart and table builders for the Streamlit pages, cached in the ``VillageStore``.
+
+The builders only depend on their arguments (no ``st`` calls), so the pages
+and the background ``CacheWarmer`` fill the same cache entries.  Charts are
+cached as rendered PNG bytes: a matplotlib ``Figure`` is not safe to draw
+from several sessions at once, bytes are.
+"""
+import io
+
+import matplotlib.ticker as ticker
+import pandas as pd
+from matplotlib.figure import Figure
+
+import projection
+import risk
+import sensitivity
+import solar_sim
+from offer_catalogue import rank_offers, village_offers
+from tariff_engine import money, stored_rate, village_financials, village_frame, village_totals
+from village_sync import PORTFOLIO
+
+WHOLESALE = "__wholesale__"        # derived-cache bucket that no village sync invalidates
+
+# Widget defaults of the analysis sections; the warmer fills exactly these
+MC_DRAWS, MC_SHARE, MC_SEED, MC_HEADROOM = 100_000, 0.4, 2024, 0.10
+SWING = 0.10
+HORIZON = 10
+ESCALATION_RANGE = (-20.0, 50.0)   # % p.a. bounds of the projection inputs
+PV_KW, BATTERY_KWH, EFFICIENCY, PV_YIELD, FEED_IN = 100.0, 200.0, 0.9, 1_400.0, 5.0
+
+
+# ───────────────────────────────────────────────────────────────
+# INPUTS
+# ───────────────────────────────────────────────────────────────
+def village_context(store, portfolio, name: str, default_rate) -> tuple:
+    """(cache key, totals, usage c/kWh, daily $/day, has stored tariff) for a village or the summary."""
+    if name == PORTFOLIO:
+        totals = portfolio.summary()
+        if totals["avg_u_rate"] is not None:
+            return PORTFOLIO, totals, totals["avg_u_rate"], totals["avg_d_daily"], True
+        return PORTFOLIO, totals, default_rate[0], default_rate[1], False
+    totals = store.derived(name, "totals", lambda: village_totals(store.rows("village_inputs", name)))
+    rate = stored_rate(store.rows("en_tariffs", name))
+    return (name, totals, *(rate or default_rate), rate is not None)
+
+
+# ───────────────────────────────────────────────────────────────
+# OVERVIEW
+# ───────────────────────────────────────────────────────────────
+def pie_chart(totals: dict, u_rate: float, aws_revenue: float, include_aws: bool) -> Figure:
+    aws_equiv_kwh = aws_revenue / (u_rate / 100) if u_rate and include_aws else 0
+    other_kwh     = max(totals["site_kwh"] - totals["res_kwh"], 0.0)
+    fig = Figure(figsize=(3.5, 3.5))
+    ax = fig.subplots()
+    # Prepare data for pie chart based on AWS fee toggle
+    if include_aws:
+        pie_data = [totals["res_kwh"], other_kwh, aws_equiv_kwh]
+        pie_colors = ["#1f77b4", "#ff7f0e", "#2ca02c"]
+        pie_labels = ["Metered Residential", "Metered Village", "AWS Fees"]
+    else:
+        pie_data = [totals["res_kwh"], other_kwh]
+        pie_colors = ["#1f77b4", "#ff7f0e"]
+        pie_labels = ["Metered Residential", "Metered Village"]
+
+    ax.pie(
+        pie_data,
+        labels=None,
+        autopct="%1.1f%%",
+        startangle=90,
+        textprops={"fontsize": 14},
+        colors=pie_colors,
+    )
+    ax.axis("equal")
+    ax.legend(pie_labels, loc="center left", bbox_to_anchor=(1, 0.5))
+    return fig
+
+
+def _text(value):
+    return None if pd.isna(value) or not str(value).strip() else str(value).strip()
+
+
+def offer_labels(ranked: pd.DataFrame) -> list:
+    """Unique "Retailer – Plan" labels; repeats get the distributor, then the plan id, then a counter."""
+    base = []
+    for offer in ranked.itertuples():
+        retailer, plan = _text(offer.retailer) or "Unknown", _text(offer.plan_name)
+        base.append(retailer if plan in (None, retailer) else f"{retailer} – {plan}")
+    labels = list(base)
+    for extra in ("distributor", "plan_id"):
+        repeats = pd.Series(labels).duplicated(keep=False).to_numpy()
+        for i in repeats.nonzero()[0]:
+            value = _text(ranked[extra].iloc[i]) if extra in ranked else None
+            if value:
+                labels[i] = f"{labels[i]} ({value})"
+    seen = {}
+    for i, label in enumerate(labels):
+        seen[label] = seen.get(label, 0) + 1
+        if seen[label] > 1 or label == "Village":
+            labels[i] = f"{label} #{seen[label]}"
+    return labels
+
+
+def competitor_table(ranked: pd.DataFrame, current: dict) -> pd.DataFrame:
+    """Formatted comparison of ranked offers against the village's current revenue."""
+    v_total = current["total_rev"]
+    rows = []
+    # Competitors, cheapest first
+    deltas = (ranked["total_cost"] - v_total) / v_total * 100
+    for offer, label, delta in zip(ranked.itertuples(), offer_labels(ranked), deltas):
+        rows.append({
+            "Provider":                label,
+            "Usage rate (c/kWh)":      f"{offer.usage_rate:.2f}",
+            "Daily charge ($/day)":    f"{offer.daily_charge:.4f}",
+            "Total Usage $":           money(offer.usage_cost),
+            "Total Supply $":          money(offer.supply_cost),
+            "Total Cost $":            money(offer.total_cost),
+            "Δ vs Village %":          f"{delta:+.1f}%",
+        })
+
+    # Village row at the bottom so it's easy to compare
+    rows.append({
+        "Provider":                "Village",
+        "Usage rate (c/kWh)":      f"{current['usage_rate']:.2f}",
+        "Daily charge ($/day)":    f"{current['daily_supply']:.4f}",
+        "Total Usage $":           money(current["usage_rev"]),
+        "Total Supply $":          money(current["supply_rev"]),
+        "Total Cost $":            money(v_total),
+        "Δ vs Village %":          "0.0%",
+    })
+
+    return (pd.DataFrame(rows)
+              .set_index("Provider")[[  # keep column order tidy
+                  "Usage rate (c/kWh)",
+                  "Daily charge ($/day)",
+                  "Total Usage $",
+                  "Total Supply $",
+                  "Total Cost $",
+                  "Δ vs Village %",
+              ]])
+
+
+# ───────────────────────────────────────────────────────────────
+# VILLAGE OPEX
+# ───────────────────────────────────────────────────────────────
+def waterfall_chart(current: dict, include_aws: bool) -> Figure:
+    # Define steps based on AWS fee toggle
+    steps = [
+        ("Total Cost",          -current["total_cost"]),
+        ("Seene Costs",         -current["seene_costs"]),
+        ("Usage Revenue",        current["usage_rev"]),
+        ("Supply Revenue",       current["supply_rev"]),
+    ]
+    colors = ["#d9534f", "#d9534f", "#28a745", "#28a745"]
+    if include_aws:
+        steps.append(("AWS Service Fee", current["aws_rev"]))
+        colors.append("#28a745")
+    steps.append(("OPEX Budget", current["opex"]))
+    colors.append("#fd7e14")
+
+    cum = [0]
+    for v in [v for _, v in steps[:-1]]:
+        cum.append(cum[-1] + v)
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    for i, (lbl, val) in enumerate(steps):
+        ax.bar(lbl, val, bottom=cum[i], color=colors[i], width=0.8)
+    ax.yaxis.set_major_formatter(
+        ticker.FuncFormatter(lambda x, pos: f'${x:,.0f}')
+    )
+    ax.grid(axis="y", alpha=0.3)
+    ax.tick_params(axis="x", labelrotation=90)
+    return fig
+
+
+OPEX_ROWS = [
+    # (row, financials key, formula / note); AWS Service Fee only when toggled on
+    ("Total Cost",           "total_cost",   "Input from invoices"),
+    ("Seene Costs",          "seene_costs",  "Fixed platform cost"),
+    ("Usage Revenue",        "usage_rev",    "Total Usage × Usage Rate"),
+    ("Supply Revenue",       "supply_rev",   "NMI × Daily Supply × 365"),
+    ("AWS Service Fee",      "aws_rev",      "Fixed annual amount (can be toggled on/off)"),
+    ("Total Revenue",        "total_rev",    "Usage + Supply + AWS"),
+    ("OPEX Budget",          "opex",         "Total Cost + Seene − (Usage + Supply + AWS)"),
+    ("Usage Rate (c/kWh)",   "usage_rate",   "Current tariff"),
+    ("Daily Supply ($/day)", "daily_supply", "Current tariff"),
+]
+
+
+def opex_table(fin: dict, include_aws: bool):
+    """Current vs simulated OPEX summary, styled red (costs) / green (revenue) / orange (OPEX)."""
+    rows = [r for r in OPEX_ROWS if include_aws or r[0] != "AWS Service Fee"]
+    if not include_aws:
+        rows = [(k, f, n.replace(" + AWS", "")) for k, f, n in rows]
+
+    def fmt(v, row):
+        if "Rate" in row or "Supply ($/day)" in row:
+            return f"{v:.4f}" if "Supply" in row else f"{v:.2f}"
+        return money(v)
+
+    comparison_df = pd.DataFrame({
+        "Current"  : [fmt(fin["current"][f], k)   for k, f, _ in rows],
+        "Simulated": [fmt(fin["simulated"][f], k) for k, f, _ in rows],
+        "Formula / Note": [n for _, _, n in rows],
+    }, index=[k for k, _, _ in rows])
+
+    def highlight_rows(row):
+        idx = row.name
+        if idx in {"Total Cost", "Seene Costs"}:
+            return ['background-color:#f8d7da;color:#721c24']*3   # red
+        if idx in {"Usage Revenue", "Supply Revenue", "AWS Service Fee", "Total Revenue"}:
+            return ['background-color:#d4edda;color:#155724']*3   # green
+        if idx == "OPEX Budget":
+            return ['background-color:#ffe8cc;color:#7f3b00']*3   # orange
+        return ['']*3
+
+    return comparison_df.style.apply(highlight_rows, axis=1)
+
+
+# ───────────────────────────────────────────────────────────────
+# WHOLESALE
+# ───────────────────────────────────────────────────────────────
+def load_wholesale(client) -> pd.DataFrame:
+    """Wholesale price history; ``attrs["stale"]`` marks a snapshot served while Supabase is down."""
+    resp = (client.table("wholesale_price_nem")
+                  .select("state,year,quarter,average_price")
+                  .execute())
+    df = pd.DataFrame(resp.data)
+    df.attrs["stale"] = getattr(resp, "stale", False)
+    df.columns = [c.strip().lower() for c in df.columns]
+    for col in {"state","year","quarter","average_price"} - set(df.columns):
+        df[col] = pd.NA
+    df["period"] = (
+        pd.to_numeric(df["year"], errors="coerce").fillna(0).astype(int).astype(str)
+        + "-" + df["quarter"].str.upper().str.strip()
+    )
+    return df
+
+
+def wholesale_series(df: pd.DataFrame, since: int = 2021) -> dict:
+    """Four-quarter rolling average per state on a shared period axis."""
+    w_df = df[df["year"].astype(int) >= since].copy()   # filter
+
+    periods = sorted(w_df["period"].unique(), key=lambda p: (int(p[:4]), p[5:]))
+    pos_map = {p:i for i,p in enumerate(periods)}
+    w_df["pos"] = w_df["period"].map(pos_map)
+
+    w_df = w_df.sort_values(["state","year","quarter"]).reset_index(drop=True)
+    w_df["smoothed"] = (w_df.groupby("state")["average_price"]
+                            .transform(lambda s: s.rolling(4, min_periods=1).mean()))
+
+    years = sorted({p[:4] for p in periods})
+    return {
+        "frame":  w_df,
+        "states": sorted(w_df["state"].dropna().unique()),
+        "years":  years,
+        "ticks":  [pos_map[f"{y}-Q1"] for y in years if f"{y}-Q1" in pos_map],
+    }
+
+
+def wholesale_chart(series: dict, states) -> Figure:
+    fig = Figure(figsize=(8, 3.5))
+    ax = fig.subplots()
+    for state, grp in series["frame"].groupby("state"):
+        if state in states:
+            ax.plot(grp["pos"], (grp["smoothed"] / 10) + 23,
+                    marker="o", linewidth=2, label=state)
+
+    ax.set_xticks(series["ticks"])
+    ax.set_xticklabels(series["years"], rotation=90)
+    ax.set_xlabel("Year")
+    ax.set_ylabel("Average Price (c/kWh)")
+    ax.set_title("Rolling Average by State")
+    ax.grid(axis="y", alpha=0.3)
+    ax.legend(title="State", bbox_to_anchor=(1.02, 0.5), loc="center left")
+    return fig
+
+
+# ───────────────────────────────────────────────────────────────
+# CACHED ACCESSORS  (shared by the pages and the cache warmer)
+# ───────────────────────────────────────────────────────────────
+def png(fig: Figure) -> bytes:
+    """``fig`` rendered the way ``st.pyplot`` would; show with ``st.image``."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=200)
+    return buf.getvalue()
+
+
+def cached_pie(scenarios, store, key, totals, u_rate, aws_revenue, include_aws) -> bytes:
+    # Follows the sidebar rate for villages without a stored tariff, like the waterfall;
+    # the daily charge doesn't enter the pie
+    return scenarios.get(scenarios.key("pie", store, key, u_rate, 0.0, include_aws, aws_revenue),
+                         lambda: png(pie_chart(totals, u_rate, aws_revenue, include_aws)))
+
+
+def cached_waterfall(scenarios, store, key, current, include_aws) -> bytes:
+    # Current figures follow the sidebar rates for villages without a stored tariff,
+    # so the waterfall lives in the bounded scenario cache rather than the per-village one
+    return scenarios.get(
+        scenarios.key("waterfall", store, key, current["usage_rate"], current["daily_supply"], include_aws),
+        lambda: png(waterfall_chart(current, include_aws)),
+    )
+
+
+def cached_competitors(scenarios, store, name, totals, current, include_aws, offers=None,
+                       limit=10) -> pd.DataFrame:
+    return scenarios.get(
+        scenarios.key("competitors", store, name, current["usage_rate"], current["daily_supply"],
+                      include_aws, limit),
+        lambda: competitor_table(
+            rank_offers(village_offers(store, name, offers), totals["qty_total"], totals["nmi_total"], n=limit),
+            current,
+        ),
+    )
+
+
+def cached_wholesale(store, client) -> dict:
+    """Raw frame, its content digest and the smoothed series; fetched once per process.
+
+    A stale snapshot is served but not kept, so the next call refetches and
+    the bucket fills with live data once Supabase recovers.
+    """
+    raw = store.derived(WHOLESALE, "raw", lambda: load_wholesale(client))
+    series = store.derived(WHOLESALE, "series", lambda: {
+        "raw": raw, "digest": f"{int(pd.util.hash_pandas_object(raw, index=False).sum()):x}",
+        "stale": raw.attrs.get("stale", False), **wholesale_series(raw)})
+    if series["stale"]:
+        store.discard(WHOLESALE)
+    return series
+
+
+def _from_wholesale(store, series, key, compute):
+    # Results built on a stale snapshot aren't kept either
+    return compute() if series["stale"] else store.derived(WHOLESALE, key, compute)
+
+
+def cached_wholesale_chart(store, client, states) -> bytes:
+    series = cached_wholesale(store, client)
+    return _from_wholesale(store, series, ("chart", tuple(sorted(states))),
+                           lambda: png(wholesale_chart(series, states)))
+
+
+def cached_financials(scenarios, store, key, totals, u_rate, d_daily, sim_rate, include_aws) -> dict:
+    """``village_financials`` for a scenario; ``sim_rate`` should already be quantized."""
+    return scenarios.get(scenarios.key("financials", store, key, *sim_rate, include_aws),
+                         lambda: village_financials(totals, u_rate, d_daily, *sim_rate, include_aws))
+
+
+# ───────────────────────────────────────────────────────────────
+# PORTFOLIO ANALYSES  (Monte Carlo, sensitivity, projection, solar)
+# ───────────────────────────────────────────────────────────────
+def price_draws(draws_cache, store, client, draws=MC_DRAWS, seed=MC_SEED) -> risk.PriceDraws:
+    # Draws depend only on the price history, so every rate scenario shares them
+    wholesale = cached_wholesale(store, client)
+    return draws_cache.get(("price_draws", draws, seed, wholesale["digest"]),
+                           lambda: risk.PriceDraws(wholesale["raw"], draws, seed))
+
+
+def cached_monte_carlo(scenarios, draws_cache, store, client, portfolio, sim_rate, include_aws,
+                       draws=MC_DRAWS, share=MC_SHARE, seed=MC_SEED, headroom=MC_HEADROOM) -> tuple:
+    """(``RiskResult``, ``PriceDraws``) for every village; ValueError without enough price history."""
+    wholesale = cached_wholesale(store, client)
+    prices = price_draws(draws_cache, store, client, draws, seed)
+    mc = scenarios.get(
+        scenarios.key("monte_carlo", store, PORTFOLIO, *sim_rate, include_aws,
+                      draws, share, seed, headroom, wholesale["digest"]),
+        lambda: risk.simulate(village_frame(store, portfolio, include_aws, sim_rate), wholesale["raw"],
+                              wholesale_share=share, sim_rate=sim_rate, headroom=headroom, prices=prices),
+    )
+    return mc, prices
+
+
+def cached_sensitivity(scenarios, store, portfolio, sim_rate, include_aws, swing=SWING):
+    return scenarios.get(
+        scenarios.key("sensitivity", store, PORTFOLIO, *sim_rate, include_aws, swing),
+        lambda: sensitivity.run(village_frame(store, portfolio, include_aws, sim_rate), sim_rate, swing),
+    )
+
+
+def wholesale_trend(store, client) -> float:
+    """Annual wholesale escalation; depends on the price history only."""
+    series = cached_wholesale(store, client)
+    return _from_wholesale(store, series, "trend",
+                           lambda: projection.wholesale_escalation(series["raw"]))
+
+
+def default_cost_escalation(trend: float) -> float:
+    """Initial custom cost escalation (% p.a.): the wholesale trend, within the input's bounds."""
+    lo, hi = ESCALATION_RANGE
+    return min(max(round(trend * 100, 1), lo), hi)
+
+
+def projection_scenarios(trend: float, cost_pct: float, tariff_pct: float = 0.0,
+                         seene_pct: float = 0.0) -> dict:
+    """Built-in scenarios plus the custom one from the % p.a. inputs."""
+    return projection.default_scenarios(trend, {
+        "cost": cost_pct / 100, "tariff": tariff_pct / 100, "seene": seene_pct / 100,
+    })
+
+
+def cached_projection(scenarios, store, portfolio, sim_rate, include_aws, proj_scenarios,
+                      horizon=HORIZON) -> tuple:
+    """(``Projection`` of every village, its CSV)."""
+    key = scenarios.key("projection", store, PORTFOLIO, *sim_rate, include_aws, horizon,
+                        tuple((k, tuple(v.values())) for k, v in proj_scenarios.items()))
+    proj = scenarios.get(key, lambda: projection.project(
+        village_frame(store, portfolio, include_aws, sim_rate), proj_scenarios, horizon))
+    return proj, scenarios.get(("csv",) + key, lambda: proj.to_frame().to_csv(index=False))
+
+
+def solar_grid(pv_kw: float, battery_kwh: float) -> tuple:
+    """Sizing sweep around the chosen system; the chosen point is always on the grid."""
+    return (sorted({*(pv_kw * f for f in (0, 0.25, 0.5, 0.75, 1, 1.5, 2)), pv_kw}),
+            sorted({*(battery_kwh * f for f in (0, 0.5, 1, 2)), battery_kwh}))
+
+
+def cached_solar(scenarios, store, portfolio, key, sim_rate, pv_kw=PV_KW, battery_kwh=BATTERY_KWH,
+                 battery_kw=None, efficiency=EFFICIENCY, pv_yield=PV_YIELD, feed_in=FEED_IN,
+                 import_rate=0.0, loads=None, pv_profiles=None, uploads=()) -> tuple:
+    """(``SolarResult``, its CSV) for one village, or every village when ``key`` is PORTFOLIO.
+
+    ``battery_kw`` defaults to half the capacity; ``uploads`` identifies any
+    supplied ``loads``/``pv_profiles``.
+    """
+    pv_grid, bat_grid = solar_grid(pv_kw, battery_kwh)
+    ratio = battery_kw / battery_kwh if battery_kw is not None and battery_kwh else 0.5
+    # The AWS fee doesn't touch gate flows; the sim rate stands in for missing tariffs
+    solar_key = ("solar", key, store.digest(key), tuple(pv_grid), tuple(bat_grid), ratio,
+                 efficiency, pv_yield, feed_in, import_rate or sim_rate[0], uploads)
+
+    def run():
+        sites = village_frame(store, portfolio, True, sim_rate, with_summary=False)
+        if key != PORTFOLIO:
+            sites = sites.loc[[key]]
+        if import_rate:
+            sites = sites.assign(import_rate=import_rate)
+        return solar_sim.simulate(sites, pv_grid, bat_grid, [b * ratio for b in bat_grid], efficiency,
+                                  feed_in, pv_yield, loads, pv_profiles)
+
+    solar = scenarios.get(solar_key, run)
+    return solar, scenarios.get(("csv",) + solar_key, lambda: solar.table.reset_index().to_csv(index=False))
+
+
+def warm_wholesale(store, client, draws_cache=None):
+    """Wholesale series, the all-states chart, the trend and the default price draws."""
+    series = cached_wholesale(store, client)
+    cached_wholesale_chart(store, client, series["states"])
+    wholesale_trend(store, client)
+    if draws_cache is not None:
+        try:
+            price_draws(draws_cache, store, client)
+        except ValueError:
+            pass                                 # not enough history; the page says so
+
+
+def warm_village(store, portfolio, scenarios, name, default_rate, include_aws=True, offers=None,
+                 limit=10, client=None, draws_cache=None):
+    """Fill every cache entry the pages read for a village at the sidebar and widget defaults.
+
+    The portfolio-wide analyses are filled when ``name`` is PORTFOLIO; the
+    Monte Carlo needs ``client`` and ``draws_cache``.
+    """
+    key, totals, u, d, has_rate = village_context(store, portfolio, name, default_rate)
+    fin = cached_financials(scenarios, store, key, totals, u, d, default_rate, include_aws)
+    cached_pie(scenarios, store, key, totals, u, fin["current"]["aws_rev"], include_aws)
+    cached_waterfall(scenarios, store, key, fin["current"], include_aws)
+    if key != PORTFOLIO and u and d:
+        cached_competitors(scenarios, store, key, totals, fin["current"], include_aws, offers, limit)
+    cached_solar(scenarios, store, portfolio, key, default_rate)
+    if key != PORTFOLIO:
+        return
+    cached_sensitivity(scenarios, store, portfolio, default_rate, include_aws)
+    if client is None:
+        return
+    trend = wholesale_trend(store, client)
+    cached_projection(scenarios, store, portfolio, default_rate, include_aws,
+                      projection_scenarios(trend, default_cost_escalation(trend)))
+    if draws_cache is not None:
+        try:
+            cached_monte_carlo(scenarios, draws_cache, store, client, portfolio, default_rate, include_aws)
+        except ValueError:
+            pass
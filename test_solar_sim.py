@@ -0,0 +1,39 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import solar_sim
+
+
+def _csv(stamps, kwh) -> io.StringIO:
+    return io.StringIO(pd.DataFrame({"timestamp": stamps, "gate": kwh}).to_csv(index=False))
+
+
+def test_iso_half_hourly_profile_round_trips():
+    idx = pd.date_range("2023-01-01", periods=solar_sim.STEPS, freq="30min")
+    kwh = np.random.default_rng(0).uniform(0, 5, len(idx))
+    profile = solar_sim.read_profile(_csv(idx.strftime("%Y-%m-%d %H:%M:%S"), kwh))
+    np.testing.assert_allclose(profile, kwh)
+
+
+def test_day_first_timestamps():
+    idx = pd.date_range("2023-01-01", periods=solar_sim.STEPS, freq="30min")
+    kwh = np.arange(len(idx), dtype=float)
+    profile = solar_sim.read_profile(_csv(idx.strftime("%d/%m/%Y %H:%M"), kwh))
+    np.testing.assert_allclose(profile, kwh)
+
+
+def test_hourly_readings_spread_over_half_hours():
+    idx = pd.date_range("2023-01-01", periods=solar_sim.STEPS // 2, freq="h")
+    profile = solar_sim.read_profile(_csv(idx.strftime("%Y-%m-%d %H:%M"), 2.0))
+    np.testing.assert_allclose(profile, 1.0)
+
+
+def test_unreadable_timestamps_raise():
+    idx = pd.date_range("2023-01-01", periods=96, freq="30min")
+    stamps = list(idx.strftime("%Y-%m-%d %H:%M"))
+    stamps[10:20] = ["not a date"] * 10
+    with pytest.raises(ValueError, match="timestamps"):
+        solar_sim.read_profile(_csv(stamps, 1.0))
@@ -0,0 +1,236 @@
+"""Change detection over the village tables.
+
+``VillageStore`` keeps a process-wide snapshot of ``village_inputs``,
+``en_tariffs`` and ``competitor_offers`` grouped by village.  Each poll only
+re-reads what changed (via an ``updated_at`` watermark when the table has one,
+row hashes otherwise) and drops the cached rows and derived results of the
+villages that actually changed.  Every other village stays warm.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+WATCHED_TABLES = ("village_inputs", "en_tariffs", "competitor_offers")
+WATERMARK_COL = "updated_at"
+PORTFOLIO = "__portfolio__"     # derived results that depend on every village
+
+log = logging.getLogger(__name__)
+
+
+def row_digest(rows) -> str:
+    """Order-independent hash of a village's rows."""
+    payload = sorted(json.dumps(r, sort_keys=True, default=str) for r in rows)
+    return hashlib.sha1("\n".join(payload).encode()).hexdigest()
+
+
+def village_key(row) -> str:
+    return str(row.get("village_name") or "").strip()
+
+
+def _group(rows):
+    grouped = {}
+    for r in rows:
+        name = village_key(r)
+        if name:
+            grouped.setdefault(name, []).append(r)
+    return grouped
+
+
+class VillageStore:
+    """Per-village row snapshot with fine-grained invalidation.
+
+    ``refresh()`` is throttled to ``poll_interval`` seconds and never blocks a
+    caller while another one is already polling; ``start_polling()`` runs it on
+    a background thread.  Without an ``updated_at`` column a poll re-reads the
+    whole table and hashes every row, so keep it off the request path.
+    Subscribers registered with ``subscribe()`` are called with the set of
+    changed village names after each sync; ``before_invalidate`` subscribers
+    run inside the sync, before the generation moves.
+    """
+
+    def __init__(self, client, poll_interval: float = 30.0, full_sync_every: int = 20):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.full_sync_every = full_sync_every
+        self._lock = threading.RLock()
+        self._poll_lock = threading.Lock()
+        self._rows = {t: {} for t in WATCHED_TABLES}         # table -> village -> rows
+        self._table_digests = {t: {} for t in WATCHED_TABLES}
+        self._watermarks = {t: None for t in WATCHED_TABLES}
+        self._digests = {}                                   # village -> digest over all tables
+        self._derived = {}                                   # village -> {key: value}
+        self._listeners = []
+        self._hooks = []                                     # run before the generation bump
+        self._views = {}                                     # village -> page views
+        self._polls = 0
+        self._last_poll = None
+        self.generation = 0
+        self.hits = self.misses = 0
+
+    # ── polling ───────────────────────────────────────────────────
+    def refresh(self, force: bool = False) -> set:
+        """Poll the watched tables; return the villages that changed."""
+        if self._last_poll is None:
+            self._poll_lock.acquire()              # first load: everyone waits for it
+        elif not self._poll_lock.acquire(blocking=False):
+            return set()                           # another session is already polling
+        try:
+            now = time.monotonic()
+            if (not force and self._last_poll is not None
+                    and now - self._last_poll < self.poll_interval):
+                return set()
+            full = force or self._polls % self.full_sync_every == 0
+            changed = set()
+            for table in WATCHED_TABLES:
+                try:
+                    changed |= self._sync_table(table, full)
+                except Exception as e:
+                    if self._last_poll is None:
+                        raise
+                    # Keep serving the current snapshot; the next poll retries
+                    log.warning("Could not sync %s: %s", table, e)
+            self._polls += 1
+            self._last_poll = now
+            if changed:
+                try:
+                    for fn in list(self._hooks):
+                        fn(changed)
+                finally:
+                    self._invalidate(changed)
+        finally:
+            self._poll_lock.release()
+        if changed:
+            for fn in list(self._listeners):
+                fn(changed)
+        return changed
+
+    def start_polling(self):
+        """Call ``refresh()`` every ``poll_interval`` seconds on a daemon thread."""
+        def poll():
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    self.refresh()
+                except Exception:
+                    log.exception("Village poll failed")
+        threading.Thread(target=poll, name="village-poll", daemon=True).start()
+        return self
+
+    def _sync_table(self, table: str, full: bool) -> set:
+        mark = self._watermarks[table]
+        if full or mark is None:
+            rows = self.client.table(table).select("*").execute().data
+            grouped = _group(rows)
+            candidates = set(grouped) | set(self._rows[table])
+            marks = [str(r[WATERMARK_COL]) for r in rows if r.get(WATERMARK_COL)]
+        else:
+            fresh = (self.client.table(table)
+                         .select(f"village_name,{WATERMARK_COL}")
+                         .gt(WATERMARK_COL, mark)
+                         .execute()
+                         .data)
+            if not fresh:
+                return set()
+            raw_names = sorted({r["village_name"] for r in fresh if r.get("village_name")})
+            rows = (self.client.table(table)
+                        .select("*")
+                        .in_("village_name", raw_names)
+                        .execute()
+                        .data)
+            grouped = _group(rows)
+            candidates = {village_key(r) for r in fresh} - {""}
+            marks = [str(r[WATERMARK_COL]) for r in fresh if r.get(WATERMARK_COL)]
+        # Deleted rows are only noticed by the periodic full sync
+        self._watermarks[table] = max(marks + ([mark] if mark else []), default=None)
+
+        changed = set()
+        with self._lock:
+            for name in candidates:
+                new_rows = grouped.get(name, [])
+                digest = row_digest(new_rows) if new_rows else None
+                if digest == self._table_digests[table].get(name):
+                    continue
+                if new_rows:
+                    self._rows[table][name] = new_rows
+                    self._table_digests[table][name] = digest
+                else:
+                    self._rows[table].pop(name, None)
+                    self._table_digests[table].pop(name, None)
+                changed.add(name)
+        return changed
+
+    def _invalidate(self, villages):
+        with self._lock:
+            for name in villages:
+                self._derived.pop(name, None)
+                parts = [self._table_digests[t].get(name) or "" for t in WATCHED_TABLES]
+                self._digests[name] = hashlib.sha1("|".join(parts).encode()).hexdigest()
+            self._derived.pop(PORTFOLIO, None)
+            self.generation += 1
+
+    def subscribe(self, fn, before_invalidate: bool = False):
+        """Call ``fn(changed)`` after every sync that changed villages.
+
+        ``before_invalidate`` hooks run while the sync still holds the poll
+        lock and before ``generation`` moves, so state they maintain (e.g.
+        ``PortfolioAggregate``) is current for anything cached under the new
+        generation.
+        """
+        (self._hooks if before_invalidate else self._listeners).append(fn)
+        return fn
+
+    # ── row access ────────────────────────────────────────────────
+    def villages(self, table: str = "village_inputs") -> list:
+        with self._lock:
+            return sorted(self._rows[table])
+
+    def rows(self, table: str, village: str) -> list:
+        with self._lock:
+            return list(self._rows[table].get(village, []))
+
+    def row(self, table: str, village: str):
+        rows = self.rows(table, village)
+        return rows[0] if rows else None
+
+    def all_rows(self, table: str) -> list:
+        with self._lock:
+            return [r for rows in self._rows[table].values() for r in rows]
+
+    def digest(self, village: str) -> str:
+        """Content hash of a village's rows across all watched tables."""
+        with self._lock:
+            if village == PORTFOLIO:
+                return str(self.generation)
+            return self._digests.get(village, "")
+
+    # ── usage ─────────────────────────────────────────────────────
+    def record_view(self, village: str):
+        with self._lock:
+            self._views[village] = self._views.get(village, 0) + 1
+
+    def view_counts(self) -> dict:
+        with self._lock:
+            return dict(self._views)
+
+    # ── derived results ───────────────────────────────────────────
+    def derived(self, village: str, key, compute):
+        """Return ``compute()`` cached until ``village`` (or any, for PORTFOLIO) changes."""
+        with self._lock:
+            bucket = self._derived.setdefault(village, {})
+            if key in bucket:
+                self.hits += 1
+                return bucket[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            # Skip the store if the village was invalidated while we computed
+            if self._derived.get(village) is bucket:
+                bucket[key] = value
+        return value
+
+    def discard(self, village: str):
+        """Drop ``village``'s derived results so the next call recomputes them."""
+        with self._lock:
+            self._derived.pop(village, None)